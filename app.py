@@ -1,184 +1,172 @@
-from flask import Flask, render_template, request, redirect, session, url_for, flash
-import sqlite3, os, time, hashlib, secrets, string
-from blockchain import Blockchain
+from flask import Flask, render_template, request, redirect, session, url_for, flash, jsonify, g, Response, make_response
+from markupsafe import Markup
+import sqlite3, os, time, threading, atexit, hashlib
+from shards import ShardedLedger
+from ledger_writer import LedgerWriter
+from replication import ReplicationHub
+from credentials import (hash_password, verify_password, needs_rehash, run_in_pool, CredentialsBusy,
+                         generate_anonymous_token, generate_coin_id)
+from schema import migrate_schema
+import db, metrics
 
 app = Flask(__name__, static_folder='static')
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_secret_key_change_in_production')
-blockchain = Blockchain()
-DB_FILE = "database.db"
-
-# ----------------- Security Functions -----------------
-def hash_password(password):
-    """Hash password using SHA-256 with salt"""
-    salt = secrets.token_hex(16)
-    return hashlib.sha256((password + salt).encode()).hexdigest(), salt
-
-def verify_password(password, hashed_password, salt):
-    """Verify password against hash"""
-    return hashlib.sha256((password + salt).encode()).hexdigest() == hashed_password
-
-def generate_anonymous_token():
-    """Generate a secure anonymous token"""
-    return "ANON_" + ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(12))
-
-def generate_coin_id():
-    """Generate a unique coin id"""
-    return "COIN_" + secrets.token_hex(8).upper()
-
-def migrate_database():
-    """Migrate existing database to new schema"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    try:
-        # Check if we need to migrate existing voters
-        c.execute("SELECT voter_id, password FROM voters WHERE salt IS NULL LIMIT 1")
-        old_voters = c.fetchall()
-        
-        if old_voters:
-            print("🔄 Migrating existing voters to new security schema...")
-            for voter_id, old_password in old_voters:
-                # Generate new salt and hash for old passwords
-                hashed_pwd, salt = hash_password(old_password)
-                anonymous_token = generate_anonymous_token()
-                
-                c.execute("UPDATE voters SET password=?, salt=?, anonymous_token=? WHERE voter_id=?", 
-                         (hashed_pwd, salt, anonymous_token, voter_id))
-            
-            print("✅ Database migration completed!")
-        
-        conn.commit()
-    except Exception as e:
-        print(f"Migration note: {e}")
-    finally:
-        conn.close()
+# The ledger, split into CHAIN_SHARDS chains by constituency (see shards.py). ``blockchain`` is
+# shard 0, which is the whole ledger unless sharding is turned on.
+ledger = ShardedLedger()
+blockchain = ledger.shards[0]
+atexit.register(ledger.stop)
+# Seal committed votes onto their shard's chain in the background; see ledger_writer.py
+ledger_writers = [LedgerWriter(shard, shard=i) for i, shard in enumerate(ledger.shards)]
+for _writer in ledger_writers:
+    atexit.register(_writer.stop)
+# Streams blocks to validator node processes when REPLICATION_ADDRESS is set; see replication.py
+replication_hub = ReplicationHub(blockchain, os.environ['REPLICATION_ADDRESS']) if os.environ.get('REPLICATION_ADDRESS') else None
+if replication_hub is not None and ledger.count > 1:
+    print("⚠ REPLICATION_ADDRESS replicates shard 0 only; other shards are co-signed locally")
+LEDGER_PAGE_SIZE = 50
+LEDGER_MAX_PAGE_SIZE = 200
+
+# Serializes "commit vote row, then queue ballot for the ledger writer" within this process so
+# ballots reach the ledger in commit order. Nothing under it waits on the writer: the queue
+# hand-off never blocks. Across processes the block log's file lock keeps appends on the true
+# chain tip.
+vote_handoff_lock = threading.Lock()
+
+class VoteRejected(Exception):
+    """Raised inside the vote transaction to roll it back with a message for the voter."""
+
+# ----------------- Metrics -----------------
+metrics.histogram("http_request_seconds", "Request latency by endpoint and method")
+metrics.counter("http_requests_total", "Requests by endpoint, method and status")
+metrics.counter("votes_cast_total", "Votes committed and handed to the ledger")
+metrics.counter("votes_rejected_total", "Vote attempts rejected (already voted / no coin)")
+metrics.counter("dashboard_cache_total", "Dashboard and ledger page requests by cache outcome (hit, miss, not_modified)")
+metrics.gauge("chain_height", "Blocks on the chain (all shards)", lambda: ledger.get_height())
+metrics.gauge("ledger_queue_depth", "Committed votes waiting for the ledger writers", lambda: sum(w.pending() for w in ledger_writers))
+if replication_hub is not None:
+    metrics.gauge("replication_nodes", "Validator nodes connected to this process", lambda: len(replication_hub.nodes()))
+
+if metrics.ENABLED:
+    @app.before_request
+    def _start_request_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop("_request_started", None)
+        if started is not None:
+            endpoint = request.endpoint or "unknown"
+            metrics.observe("http_request_seconds", time.perf_counter() - started,
+                            (("endpoint", endpoint), ("method", request.method)))
+            metrics.inc("http_requests_total",
+                        labels=(("endpoint", endpoint), ("method", request.method), ("status", str(response.status_code))))
+        return response
+
+# PROFILE_REQUESTS=1 dumps a cProfile of every request into PROFILE_DIR (default ./profiles)
+if os.environ.get('PROFILE_REQUESTS', '0') not in ('', '0'):
+    metrics.profile_requests(app, os.environ.get('PROFILE_DIR', 'profiles'))
 
 # ----------------- DB Setup -----------------
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # Create voters table with new schema
-    c.execute("""CREATE TABLE IF NOT EXISTS voters(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    voter_id TEXT UNIQUE,
-                    name TEXT,
-                    password TEXT,
-                    salt TEXT,
-                    anonymous_token TEXT UNIQUE,
-                    has_voted INTEGER DEFAULT 0,
-                    mobile TEXT,
-                    aadhaar_hash TEXT,
-                    aadhaar_last4 TEXT,
-                    aadhaar_verified INTEGER DEFAULT 0)""")
-    
-    # Add new columns to existing voters table if they don't exist
-    try:
-        c.execute("ALTER TABLE voters ADD COLUMN salt TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        c.execute("ALTER TABLE voters ADD COLUMN anonymous_token TEXT UNIQUE")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        c.execute("ALTER TABLE voters ADD COLUMN has_voted INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-
-    # New columns for Aadhaar + mobile
-    try:
-        c.execute("ALTER TABLE voters ADD COLUMN mobile TEXT")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute("ALTER TABLE voters ADD COLUMN aadhaar_hash TEXT")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute("ALTER TABLE voters ADD COLUMN aadhaar_last4 TEXT")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute("ALTER TABLE voters ADD COLUMN aadhaar_verified INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass
-    
-    # Create admin table
-    c.execute("""CREATE TABLE IF NOT EXISTS admin(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE,
-                    password TEXT)""")
-    
-    # Create votes table with new schema
-    c.execute("""CREATE TABLE IF NOT EXISTS votes(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    anonymous_token TEXT,
-                    candidate TEXT,
-                    timestamp TEXT)""")
-    
-    # Update existing votes table if it has old schema
-    try:
-        c.execute("ALTER TABLE votes ADD COLUMN anonymous_token TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        c.execute("ALTER TABLE votes ADD COLUMN timestamp TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-
-    # Create coins table (one coin per voter, spent when voting)
-    c.execute("""CREATE TABLE IF NOT EXISTS coins(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    coin_id TEXT UNIQUE,
-                    voter_id TEXT,
-                    spent INTEGER DEFAULT 0,
-                    spent_to TEXT,
-                    spent_at TEXT)""")
-    # Backfill: mint a coin for any voter lacking one
-    try:
-        c.execute("""
-            SELECT v.voter_id FROM voters v
-            LEFT JOIN coins c2 ON c2.voter_id = v.voter_id
-            WHERE c2.voter_id IS NULL
-        """)
-        missing = [row[0] for row in c.fetchall()]
-        for vid in missing:
-            c.execute("INSERT OR IGNORE INTO coins(coin_id, voter_id, spent) VALUES (?,?,0)", (generate_coin_id(), vid))
-        conn.commit()
-    except Exception:
-        pass
-    
-    # Migrate existing data if needed
-    try:
-        c.execute("SELECT voter_id FROM voters WHERE anonymous_token IS NULL LIMIT 1")
-        if c.fetchone():
-            # Generate anonymous tokens for existing voters
-            c.execute("SELECT voter_id FROM voters WHERE anonymous_token IS NULL")
-            existing_voters = c.fetchall()
-            for voter in existing_voters:
-                token = generate_anonymous_token()
-                c.execute("UPDATE voters SET anonymous_token=? WHERE voter_id=?", (token, voter[0]))
-    except sqlite3.OperationalError:
-        pass  # No existing data to migrate
-    
-    conn.commit()
-    
+    migrate_schema()
+    # Replays committed votes a previous run did not get onto the chain, then starts the writer
+    for writer in ledger_writers:
+        writer.start()
+    # Commits shard tips to the root chain every ROOT_BLOCK_MS when sharded
+    ledger.start()
+    if replication_hub is not None and replication_hub.start():
+        atexit.register(replication_hub.stop)
     # Create default admin (change password in production)
-    admin_password = os.environ.get('ADMIN_PASSWORD', 'admin123')
-    c.execute("INSERT OR IGNORE INTO admin(username,password) VALUES (?,?)", ("admin", admin_password))
-    conn.commit()
-    
-    # Backfill existing rows to not block old users: set aadhaar_verified=1 if NULL
-    try:
-        c.execute("UPDATE voters SET aadhaar_verified=1 WHERE aadhaar_verified IS NULL")
-        conn.commit()
-    except sqlite3.OperationalError:
-        pass
-    conn.close()
+    if not db.query_one("SELECT 1 FROM admin WHERE username=?", ("admin",)):
+        hashed_pwd, salt = hash_password(os.environ.get('ADMIN_PASSWORD', 'admin123'))
+        db.execute("INSERT OR IGNORE INTO admin(username,password,salt) VALUES (?,?,?)", ("admin", hashed_pwd, salt))
+
+# ----------------- Credentials -----------------
+def check_password(table, key_column, key, pwd, stored, salt):
+    """Verify a login on the KDF pool. A hash made with an older scheme or cost is replaced
+    while the plaintext is at hand; that is skipped if the pool is saturated."""
+    if not run_in_pool(verify_password, pwd, stored, salt):
+        return False
+    if needs_rehash(stored):
+        try:
+            hashed_pwd, new_salt = run_in_pool(hash_password, pwd)
+        except CredentialsBusy:
+            return True
+        # Conditional on the old hash, so a concurrent password change is not overwritten
+        db.execute(f"UPDATE {table} SET password=?, salt=? WHERE {key_column}=? AND password=?",
+                   (hashed_pwd, new_salt, key, stored))
+    return True
+
+def _busy(template, **context):
+    flash("The server is busy. Please try again in a moment.")
+    return render_template(template, **context), 503
+
+# ----------------- Response caching -----------------
+# Dashboard pages only change when a block or signature is added. Each response carries an
+# ETag built from ledger.state_tag() and the session details the page shows, so polling
+# browsers get 304s, and the results part (tally, winner, integrity check) is rendered once
+# per chain state and shared by every request in this process.
+_results_cache = {"tag": None}
+_results_lock = threading.Lock()
+_audit_lock = threading.Lock()
+
+def page_etag(tag, *parts):
+    return hashlib.sha256("|".join(map(str, (tag,) + parts)).encode()).hexdigest()[:32]
+
+def not_modified(etag):
+    """A 304 response if the client already has this version, else None."""
+    if request.if_none_match.contains(etag):
+        metrics.inc("dashboard_cache_total", labels=(("result", "not_modified"),))
+        resp = make_response("", 304)
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'private, no-cache'
+        return resp
+    return None
+
+def with_etag(resp, etag):
+    resp = make_response(resp)
+    resp.set_etag(etag)
+    # Cached by the browser only, and always revalidated
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+def results_fragment(tag, full_audit=False):
+    """Tally, winner and integrity check for the dashboard, with the rendered results HTML.
+    Cached for the chain state ``tag``; a full audit is always recomputed."""
+    if full_audit:
+        # Audits run one at a time, and outside _results_lock so polling is never held up
+        with _audit_lock:
+            return _render_results(full_audit=True)
+    with _results_lock:
+        if _results_cache["tag"] == tag:
+            metrics.inc("dashboard_cache_total", labels=(("result", "hit"),))
+            return _results_cache["results"]
+    metrics.inc("dashboard_cache_total", labels=(("result", "miss"),))
+    results = _render_results()
+    with _results_lock:
+        _results_cache.update(tag=tag, results=results)
+    return results
+
+def _render_results(full_audit=False):
+    # Running tally maintained by the blockchain ledger keeps the graph in sync with the ledger
+    tally = ledger.get_tally()
+    labels = list(tally.keys())
+    counts = [tally[lbl] for lbl in labels]
+    # Incremental check by default; ?audit=full re-verifies every block from genesis
+    valid_chain = ledger.is_valid(full=full_audit)
+
+    # Find winner
+    winner = "No votes yet"
+    if counts:
+        winner = labels[counts.index(max(counts))]
+
+    results = dict(labels=labels, counts=counts, winner=winner, valid_chain=valid_chain,
+                   chain_failure=ledger.last_failure,
+                   block_count=ledger.get_height(),
+                   vote_count=ledger.get_vote_count())
+    results["html"] = Markup(render_template("_results.html", **results))
+    return results
 
 # ----------------- Routes -----------------
 @app.route('/')
@@ -190,12 +178,12 @@ def admin_login():
     if request.method == 'POST':
         user = request.form['username']
         pwd = request.form['password']
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT * FROM admin WHERE username=? AND password=?", (user,pwd))
-        admin = c.fetchone()
-        conn.close()
-        if admin:
+        admin = db.query_one("SELECT password, salt FROM admin WHERE username=?", (user,))
+        try:
+            ok = admin is not None and check_password("admin", "username", user, pwd, admin[0], admin[1])
+        except CredentialsBusy:
+            return _busy("login.html", role="Admin")
+        if ok:
             session['admin'] = user
             return redirect(url_for('admin_dashboard'))
         flash("Invalid admin credentials.")
@@ -210,45 +198,125 @@ def logout():
 def admin_dashboard():
     if 'admin' not in session:
         return redirect(url_for('admin_login'))
-    # Tally votes directly from the blockchain ledger to keep graph in sync with ledger
-    tally = {}
-    for blk in blockchain.chain[1:]:  # skip genesis block at index 0
-        data = blk.get('data', {})
-        cand = data.get('vote')
-        if not cand:
-            continue
-        tally[cand] = tally.get(cand, 0) + 1
-    labels = list(tally.keys())
-    counts = [tally[lbl] for lbl in labels]
-    valid_chain = blockchain.is_valid()
+    # Pick up blocks appended by other worker processes
+    ledger.refresh()
+    full_audit = request.args.get('audit') == 'full'
+    tag = ledger.state_tag()
     active_validator = session.get('validator_id')
-    validators = blockchain.get_validator_ids()
+    etag = page_etag(tag, "dashboard", session['admin'], active_validator)
+    if not full_audit:
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+    results = results_fragment(tag, full_audit)
 
-    # Find winner
-    winner = "No votes yet"
-    if counts:
-        winner = labels[counts.index(max(counts))]
-
-    return render_template("admin_dashboard.html",
-                           labels=labels, counts=counts,
-                           valid_chain=valid_chain,
-                           chain=blockchain.chain,
-                           winner=winner,
+    page = render_template("admin_dashboard.html",
+                           results_html=results["html"],
+                           valid_chain=results["valid_chain"],
+                           block_count=results["block_count"],
+                           vote_count=results["vote_count"],
+                           page_size=LEDGER_PAGE_SIZE,
                            active_validator=active_validator,
-                           validators=validators,
-                           validators_full=blockchain.get_validators_full(),
-                           threshold=getattr(blockchain, 'threshold', 1))
+                           shard_count=ledger.count,
+                           validators=ledger.get_validator_ids(),
+                           validators_full=ledger.get_validators_full(),
+                           threshold=getattr(ledger, 'threshold', 1))
+    # A full audit's result is not what the ETag describes
+    return page if full_audit else with_etag(page, etag)
+
+@app.route('/admin/api/ledger')
+def admin_ledger_api():
+    """One page of the ledger by block index range: start <= index < min(end, start+limit).
+    Without ?start the newest page is returned. ?shard= picks the shard (default 0)."""
+    if 'admin' not in session:
+        return jsonify({"error": "unauthorized"}), 401
+    try:
+        shard = int(request.args.get('shard', 0))
+        chain = ledger.shard(shard)
+    except (ValueError, IndexError):
+        return jsonify({"error": f"shard must be between 0 and {ledger.count - 1}"}), 400
+    chain.refresh()
+    etag = page_etag(chain.state_tag(), "ledger", request.query_string.decode())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    height = chain.get_height()
+    try:
+        limit = int(request.args.get('limit', LEDGER_PAGE_SIZE))
+    except ValueError:
+        limit = LEDGER_PAGE_SIZE
+    limit = max(1, min(limit, LEDGER_MAX_PAGE_SIZE))
+    try:
+        start = int(request.args['start'])
+    except (KeyError, ValueError):
+        start = height - limit
+    start = max(0, min(start, max(0, height - 1)))
+    try:
+        end = min(int(request.args['end']), start + limit)
+    except (KeyError, ValueError):
+        end = start + limit
+    blocks = chain.get_blocks(start, end)
+    end = start + len(blocks)
+    return with_etag(jsonify({
+        "shard": shard,
+        "shards": ledger.count,
+        "height": height,
+        "start": start,
+        "end": end,
+        "blocks": blocks,
+        "older": max(0, start - limit) if start > 0 else None,
+        "newer": end if end < height else None,
+    }), etag)
+
+@app.route('/api/inclusion_proof')
+def inclusion_proof():
+    """Let a voter check that their ballot is committed to by a block, by anonymous token or coin id."""
+    token = request.args.get('token')
+    coin_id = request.args.get('coin_id')
+    if not token and not coin_id:
+        return jsonify({"error": "token or coin_id required"}), 400
+    proof = ledger.get_inclusion_proof(token=token, coin_id=coin_id)
+    if proof is None:
+        return _ballot_not_found()
+    return jsonify(proof)
+
+@app.route('/api/receipt')
+def receipt():
+    """Voter receipt: the block a ballot landed in, its hash, Merkle proof and signature status,
+    by anonymous token or coin id. Open to anyone, so it never reveals the vote."""
+    token = request.args.get('token')
+    coin_id = request.args.get('coin_id')
+    if not token and not coin_id:
+        return jsonify({"error": "token or coin_id required"}), 400
+    found = ledger.get_receipt(token=token, coin_id=coin_id)
+    if found is None:
+        return _ballot_not_found()
+    return jsonify(found)
+
+def _ballot_not_found():
+    # Right after startup the ballot index may still be catching up with the chain
+    backlog = ledger.index_backlog()
+    if backlog > 1000:
+        resp = jsonify({"error": "ledger index is still being built, retry shortly", "blocks_pending": backlog})
+        resp.headers['Retry-After'] = '5'
+        return resp, 503
+    return jsonify({"error": "ballot not found on the ledger yet"}), 404
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint for this worker process."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/validator', methods=['GET', 'POST'])
 def validator_login():
     if request.method == 'POST':
         vid = request.form.get('validator_id')
-        if vid and vid in blockchain.get_validator_ids():
+        if vid and vid in ledger.get_validator_ids():
             session['validator_id'] = vid
             flash(f"Logged in as validator: {vid}")
             return redirect(url_for('admin_dashboard'))
         flash('Invalid validator selection.')
-    return render_template('validator.html', validators_full=blockchain.get_validators_full())
+    return render_template('validator.html', validators_full=ledger.get_validators_full())
 
 @app.route('/validator/logout')
 def validator_logout():
@@ -262,7 +330,7 @@ def validator_sign_latest():
     if not vid:
         flash('Please log in as a validator first.')
         return redirect(url_for('validator_login'))
-    ok = blockchain.add_signature_latest(vid)
+    ok = ledger.add_signature_latest(vid)
     if ok:
         flash('Signature added to latest block (local simulation).')
     else:
@@ -275,34 +343,59 @@ def validator_sign_all():
     if not vid:
         flash('Please log in as a validator first.')
         return redirect(url_for('validator_login'))
-    n = blockchain.add_signature_all(vid)
+    n = ledger.add_signature_all(vid)
     flash(f'Added {n} signatures for validator {vid}.')
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/validator/api/sign', methods=['POST'])
+def validator_sign_api():
+    """Batch co-signing for the logged-in validator. JSON body {"start": i, "end": j} signs
+    blocks start <= index < end of shard {"shard": k} (default 0); an empty body signs every
+    block not yet signed, on every shard."""
+    vid = session.get('validator_id')
+    if not vid:
+        return jsonify({"error": "validator login required"}), 401
+    body = request.get_json(silent=True) or {}
+    try:
+        start = int(body['start']) if body.get('start') is not None else None
+        end = int(body['end']) if body.get('end') is not None else None
+        shard = int(body['shard']) if body.get('shard') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "start, end and shard must be integers"}), 400
+    try:
+        result = ledger.sign_blocks(vid, start=start, end=end, shard=shard)
+    except IndexError:
+        return jsonify({"error": f"shard must be between 0 and {ledger.count - 1}"}), 400
+    if result is None:
+        return jsonify({"error": "unknown validator"}), 400
+    result["validator"] = vid
+    result["height"] = ledger.get_height() if "shards" in result else ledger.shard(shard or 0).get_height()
+    return jsonify(result)
+
 @app.route('/register', methods=['GET','POST'])
 def register():
     if request.method == 'POST':
         name = request.form['name']
         voter_id = request.form['voter_id']
         pwd = request.form['password']
+        constituency = request.form.get('constituency', '').strip() or None
         try:
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            
-            # Hash password and generate anonymous token
-            hashed_pwd, salt = hash_password(pwd)
+            # Hash password and generate anonymous token outside the write transaction
+            hashed_pwd, salt = run_in_pool(hash_password, pwd)
             anonymous_token = generate_anonymous_token()
-            
-            # Insert user; skip mobile/OTP and mark verified by default
-            c.execute("INSERT INTO voters(voter_id,name,password,salt,anonymous_token,aadhaar_verified) VALUES (?,?,?,?,?,1)",
-                      (voter_id, name, hashed_pwd, salt, anonymous_token))
-            # Mint one coin for the voter
             coin_id = generate_coin_id()
-            c.execute("INSERT INTO coins(coin_id, voter_id, spent) VALUES (?,?,0)", (coin_id, voter_id))
-            conn.commit()
-            conn.close()
+
+            def insert_voter(conn):
+                # Insert user; skip mobile/OTP and mark verified by default
+                conn.execute("INSERT INTO voters(voter_id,name,password,salt,anonymous_token,aadhaar_verified,constituency) VALUES (?,?,?,?,?,1,?)",
+                             (voter_id, name, hashed_pwd, salt, anonymous_token, constituency))
+                # Mint one coin for the voter
+                conn.execute("INSERT INTO coins(coin_id, voter_id, spent) VALUES (?,?,0)", (coin_id, voter_id))
+            db.run_in_transaction(insert_voter)
             flash("Registration successful. You can now log in.")
             return redirect(url_for('voter_login'))
+        except CredentialsBusy:
+            return _busy("register.html")
         except sqlite3.IntegrityError:
             flash("Voter ID already registered.")
         except Exception as e:
@@ -314,13 +407,12 @@ def voter_login():
     if request.method == 'POST':
         voter_id = request.form['voter_id']
         pwd = request.form['password']
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT voter_id, password, salt, anonymous_token, has_voted FROM voters WHERE voter_id=?", (voter_id,))
-        user = c.fetchone()
-        conn.close()
-        
-        if user and verify_password(pwd, user[1], user[2]):
+        user = db.query_one("SELECT voter_id, password, salt, anonymous_token, has_voted FROM voters WHERE voter_id=?", (voter_id,))
+        try:
+            ok = user is not None and check_password("voters", "voter_id", voter_id, pwd, user[1], user[2])
+        except CredentialsBusy:
+            return _busy("login.html", role="Voter")
+        if ok:
             session['voter_id'] = voter_id
             session['anonymous_token'] = user[3]
             return redirect(url_for('vote'))
@@ -338,47 +430,56 @@ def vote():
     
     if request.method == 'POST':
         candidate = request.form['candidate']
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        # Check if already voted
-        c.execute("SELECT has_voted FROM voters WHERE voter_id= ?", (voter_id,))
-        voter_status = c.fetchone()
-        
-        if voter_status and voter_status[0] == 1:
-            flash("You have already voted.")
-        else:
-            # Fetch an unspent coin for this voter
-            c.execute("SELECT coin_id FROM coins WHERE voter_id= ? AND spent=0 LIMIT 1", (voter_id,))
-            coin_row = c.fetchone()
+
+        def cast_vote(conn):
+            # BEGIN IMMEDIATE holds the write lock, and each claim below is a conditional
+            # UPDATE, so two concurrent requests can never both spend the same ballot.
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            c = conn.execute("UPDATE voters SET has_voted=1 WHERE voter_id= ? AND has_voted=0", (voter_id,))
+            if c.rowcount != 1:
+                raise VoteRejected("You have already voted.")
+            # The voter's constituency decides which ledger shard seals the ballot
+            shard = ledger.shard_for(conn.execute("SELECT constituency FROM voters WHERE voter_id=?",
+                                                  (voter_id,)).fetchone()[0])
+
+            # Claim an unspent coin for this voter
+            coin_row = conn.execute("SELECT coin_id FROM coins WHERE voter_id= ? AND spent=0 LIMIT 1", (voter_id,)).fetchone()
             if not coin_row:
-                conn.close()
-                flash("No available voting coin found for this voter.")
-                return render_template("vote.html")
+                raise VoteRejected("No available voting coin found for this voter.")
             coin_id = coin_row[0]
+            c = conn.execute("UPDATE coins SET spent=1, spent_to= ?, spent_at= ? WHERE coin_id= ? AND spent=0",
+                             (candidate, timestamp, coin_id))
+            if c.rowcount != 1:
+                raise VoteRejected("No available voting coin found for this voter.")
 
-            # Record vote with anonymous token
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            c.execute("INSERT INTO votes(anonymous_token,candidate,timestamp) VALUES (?,?,?)",
-                      (anonymous_token, candidate, timestamp))
-            
-            # Mark voter as having voted
-            c.execute("UPDATE voters SET has_voted=1 WHERE voter_id= ?", (voter_id,))
-
-            # Spend the coin
-            c.execute("UPDATE coins SET spent=1, spent_to= ?, spent_at= ? WHERE coin_id= ?", (candidate, timestamp, coin_id))
-            
-            conn.commit()
-            conn.close()
-            
-            # Add to blockchain with anonymous token
-            blockchain.add_block({"anonymous_token": anonymous_token, "vote": candidate, "coin_id": coin_id})
-            flash("Vote recorded successfully! Your vote is anonymous and secure.")
-            return redirect(url_for('vote'))
-        conn.close()
-    return render_template("vote.html")
+            # Record vote with anonymous token; this row is the durable copy of the ballot
+            # until the ledger writer seals it and fills in block_index
+            c = conn.execute("INSERT INTO votes(anonymous_token,candidate,timestamp,coin_id,shard) VALUES (?,?,?,?,?)",
+                             (anonymous_token, candidate, timestamp, coin_id, shard))
+            return c.lastrowid, coin_id, shard
+
+        # A forked worker's writers restart lazily; run their recovery outside the hand-off lock
+        for writer in ledger_writers:
+            writer.start()
+        try:
+            with vote_handoff_lock:
+                vote_id, coin_id, shard = db.run_in_transaction(cast_vote)
+                # Sealed onto the shard's chain by its background ledger writer
+                ledger_writers[shard].submit(vote_id, {"anonymous_token": anonymous_token, "vote": candidate, "coin_id": coin_id})
+        except VoteRejected as e:
+            metrics.inc("votes_rejected_total")
+            flash(str(e))
+            return _vote_page(voter_id)
+        metrics.inc("votes_cast_total")
+        flash("Vote recorded successfully! Your vote is anonymous and secure.")
+        return redirect(url_for('vote'))
+    return _vote_page(voter_id)
+
+def _vote_page(voter_id):
+    # Once the voter has voted, show the coin id they can look their receipt up with
+    spent = db.query_one("SELECT coin_id FROM coins WHERE voter_id=? AND spent=1 LIMIT 1", (voter_id,))
+    return render_template("vote.html", receipt_code=spent[0] if spent else None)
 
 if __name__ == "__main__":
     init_db()
-    migrate_database()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""Hash index from ballot identifiers to their place on the chain.
+
+Maps every anonymous token and coin id to (block index, position in the block) so a
+receipt lookup does not scan the chain. Keys are 64-bit BLAKE2b digests of
+"t:<token>" / "c:<coin id>" kept with their values in two ``array("Q")`` columns
+(open addressing, linear probing, at most half full). Each key takes a 16-byte slot
+and a ballot has two keys, so the table costs 64-128 bytes per ballot depending on
+where the power-of-two capacity falls, instead of a dict of strings. A digest can in principle collide, so lookups return candidates and the
+caller confirms each one against the block it points to.
+
+The index can be saved next to the block log and loaded at startup together with
+the height and tip hash it covers, so only blocks added since are re-indexed.
+"""
+import hashlib, json, os, struct, threading
+from array import array
+
+_POS_BITS = 20  # ballots per block addressable in a value
+MAX_BLOCK_BALLOTS = 1 << _POS_BITS
+_EMPTY = 0
+_MIN_CAPACITY = 1 << 10
+
+
+def _key(kind, value):
+    h = int.from_bytes(hashlib.blake2b(f"{kind}:{value}".encode(), digest_size=8).digest(), "little")
+    return h or 1  # 0 marks an empty slot
+
+
+def ballot_keys(ballot):
+    """Index keys for a ballot dict: its anonymous token and coin id, when present."""
+    keys = []
+    if ballot.get("anonymous_token"):
+        keys.append(_key("t", ballot["anonymous_token"]))
+    if ballot.get("coin_id"):
+        keys.append(_key("c", ballot["coin_id"]))
+    return keys
+
+
+class BallotIndex:
+    def __init__(self, capacity=_MIN_CAPACITY):
+        capacity = max(_MIN_CAPACITY, 1 << (capacity - 1).bit_length())
+        self._keys = array("Q", bytes(8 * capacity))
+        self._vals = array("Q", bytes(8 * capacity))
+        self._count = 0
+        # Extra values for a key whose digest collided with another ballot's
+        self._extra = {}
+        self._lock = threading.Lock()
+        # Keys added since the index was last saved or loaded
+        self.unsaved = 0
+
+    def __len__(self):
+        return self._count
+
+    def add_block(self, index, ballots):
+        """Index the ballots of block ``index``."""
+        with self._lock:
+            for pos, ballot in enumerate(ballots):
+                value = (index << _POS_BITS) | pos
+                for key in ballot_keys(ballot):
+                    self._insert(key, value)
+                    self.unsaved += 1
+
+    def _insert(self, key, value):
+        if (self._count + 1) * 2 > len(self._keys):
+            self._grow()
+        keys, mask = self._keys, len(self._keys) - 1
+        slot = key & mask
+        while keys[slot] != _EMPTY:
+            if keys[slot] == key:
+                if self._vals[slot] != value and value not in self._extra.get(key, ()):
+                    self._extra.setdefault(key, []).append(value)
+                return
+            slot = (slot + 1) & mask
+        keys[slot] = key
+        self._vals[slot] = value
+        self._count += 1
+
+    def _grow(self):
+        old_keys, old_vals = self._keys, self._vals
+        size = len(old_keys) * 2
+        self._keys = array("Q", bytes(8 * size))
+        self._vals = array("Q", bytes(8 * size))
+        self._count = 0
+        for key, value in zip(old_keys, old_vals):
+            if key != _EMPTY:
+                self._insert(key, value)
+
+    def lookup(self, token=None, coin_id=None):
+        """Candidate (block index, position) pairs for a token or coin id; confirm them against the block."""
+        key = _key("t", token) if token else _key("c", coin_id)
+        with self._lock:
+            keys, mask = self._keys, len(self._keys) - 1
+            slot = key & mask
+            while keys[slot] != _EMPTY:
+                if keys[slot] == key:
+                    values = [self._vals[slot]] + self._extra.get(key, [])
+                    return [(v >> _POS_BITS, v & ((1 << _POS_BITS) - 1)) for v in values]
+                slot = (slot + 1) & mask
+        return []
+
+    # ----------------- Persistence -----------------
+    def save(self, path, height, tip_hash):
+        """Atomically write the index, recording that it covers blocks [0, height)."""
+        with self._lock:
+            keys, vals = array("Q", self._keys), array("Q", self._vals)
+            header = {"version": 1, "height": height, "tip_hash": tip_hash, "count": self._count,
+                      "capacity": len(keys), "extra": {str(k): v for k, v in self._extra.items()}}
+            self.unsaved = 0
+        data = json.dumps(header).encode()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(struct.pack("<Q", len(data)))
+            f.write(data)
+            keys.tofile(f)
+            vals.tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """(index, height, tip_hash) from a saved index, or None if missing or unreadable."""
+        try:
+            with open(path, "rb") as f:
+                (n,) = struct.unpack("<Q", f.read(8))
+                header = json.loads(f.read(n))
+                if header.get("version") != 1:
+                    return None
+                idx = cls.__new__(cls)
+                idx._keys, idx._vals = array("Q"), array("Q")
+                idx._keys.fromfile(f, header["capacity"])
+                idx._vals.fromfile(f, header["capacity"])
+        except (OSError, ValueError, KeyError, EOFError, struct.error):
+            return None
+        idx._count = header["count"]
+        idx._extra = {int(k): v for k, v in header.get("extra", {}).items()}
+        idx._lock = threading.Lock()
+        idx.unsaved = 0
+        return idx, header.get("height", 0), header.get("tip_hash")
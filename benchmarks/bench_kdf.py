@@ -0,0 +1,109 @@
+"""Password KDF benchmark: logins per second per core for each hashing scheme and cost.
+
+A login costs one verify_password call, so each configuration is timed by verifying
+a stored hash through credentials.run_in_pool from several client threads at once,
+the way concurrent /voter requests do. Reported per configuration and client count:
+logins/s, logins per CPU second, latency percentiles (queueing included) and how
+many logins the pool turned away (KDF_MAX_PENDING).
+
+    python benchmarks/bench_kdf.py --logins 200 --clients 1,4,16 --out bench_kdf.json
+    python benchmarks/bench_kdf.py --configs scrypt:n=16384,scrypt:n=32768,pbkdf2_sha256:i=600000
+"""
+import argparse, json, os, sys, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_CONFIGS = "legacy_sha256,pbkdf2_sha256:i=200000,pbkdf2_sha256:i=600000,scrypt:n=16384,scrypt:n=32768"
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def stored_hash(config):
+    """(hash, salt) for a config string like "scrypt:n=16384" or "legacy_sha256"."""
+    import hashlib, secrets
+    from credentials import KDFS, hash_password
+    if config == "legacy_sha256":
+        salt = secrets.token_hex(16)
+        return hashlib.sha256(("pw" + salt).encode()).hexdigest(), salt
+    name, _, overrides = config.partition(":")
+    params = KDFS[name][1]()
+    for kv in filter(None, overrides.split(",")):
+        k, v = kv.split("=")
+        params[k] = int(v)
+    return hash_password("pw", kdf=name, params=params)
+
+
+def bench_config(config, logins, clients):
+    from credentials import CredentialsBusy, run_in_pool, verify_password
+    hashed, salt = stored_hash(config)
+    assert verify_password("pw", hashed, salt)
+    latencies, rejected, lock = [], [0], threading.Lock()
+
+    def client(n):
+        local, busy = [], 0
+        for _ in range(n):
+            t0 = time.perf_counter()
+            try:
+                run_in_pool(verify_password, "pw", hashed, salt)
+            except CredentialsBusy:
+                busy += 1  # what a login request would answer with 503
+                continue
+            local.append((time.perf_counter() - t0) * 1000.0)
+        with lock:
+            latencies.extend(local)
+            rejected[0] += busy
+
+    per_client = max(1, logins // clients)
+    threads = [threading.Thread(target=client, args=(per_client,)) for _ in range(clients)]
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    done = len(latencies)
+    return {"config": config, "clients": clients, "logins": done, "rejected": rejected[0], "seconds": round(wall, 3),
+            "logins_per_second": round(done / wall, 1),
+            # CPU seconds actually burnt, so the figure holds whatever the core count
+            "logins_per_core_second": round(done / max(cpu, 1e-9), 1),
+            "p50_ms": round(_percentile(latencies, 50), 3), "p99_ms": round(_percentile(latencies, 99), 3),
+            "max_ms": round(max(latencies), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="comma-separated KDF configs")
+    parser.add_argument("--logins", type=int, default=200, help="logins per configuration and client count")
+    parser.add_argument("--clients", default="1,4,16", help="comma-separated concurrent client counts")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    # Configs are split on commas but may carry comma-separated parameters (scrypt:n=..,r=..)
+    configs, current = [], None
+    for part in args.configs.split(","):
+        if current is not None and "=" in part and ":" not in part:
+            current += "," + part
+            configs[-1] = current
+        else:
+            current = part
+            configs.append(part)
+
+    results = {"cpus": os.cpu_count(), "kdf_workers": os.environ.get("KDF_WORKERS", str(os.cpu_count())),
+               "runs": []}
+    for config in configs:
+        for clients in (int(c) for c in args.clients.split(",") if c.strip()):
+            print(f"Timing {config} with {clients} client(s)...", flush=True)
+            results["runs"].append(bench_config(config, args.logins, clients))
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Schema benchmark: coin lookups and coin backfill before and after the index migration.
+
+Builds a throwaway database with N voters (a small share of them without a coin),
+then times the per-vote coin lookup and the missing-coin backfill on the base schema
+and again after migration 2 adds the covering indexes.
+
+    python benchmarks/bench_schema.py --voters 10000000 --out bench_schema.json
+"""
+import argparse, json, os, random, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def populate(db, voters, without_coin, chunk=100000):
+    conn = db.get_connection()
+    for start in range(0, voters, chunk):
+        end = min(voters, start + chunk)
+        with db.transaction():
+            conn.executemany(
+                "INSERT INTO voters(voter_id,name,password,salt,anonymous_token,aadhaar_verified) VALUES (?,?,?,?,?,1)",
+                ((f"VOTER{i:010d}", "bench", "x", "y", f"ANON_{i:012d}") for i in range(start, end)))
+            conn.executemany(
+                "INSERT INTO coins(coin_id, voter_id, spent) VALUES (?,?,0)",
+                ((f"COIN_{i:016X}", f"VOTER{i:010d}") for i in range(start, end) if i % without_coin))
+        print(f"  inserted {end}/{voters} voters", flush=True)
+
+
+def time_lookups(db, voters, lookups):
+    samples = []
+    for _ in range(lookups):
+        vid = f"VOTER{random.randrange(voters):010d}"
+        t0 = time.perf_counter()
+        db.query_one("SELECT coin_id FROM coins WHERE voter_id= ? AND spent=0 LIMIT 1", (vid,))
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return {"p50_ms": _percentile(samples, 50), "p99_ms": _percentile(samples, 99),
+            "mean_ms": sum(samples) / len(samples)}
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def time_missing_coin_scan(db):
+    # The query the old init_db ran on every boot
+    t0 = time.perf_counter()
+    rows = db.query_all("""
+        SELECT v.voter_id FROM voters v
+        LEFT JOIN coins c2 ON c2.voter_id = v.voter_id
+        WHERE c2.voter_id IS NULL
+    """)
+    return {"seconds": time.perf_counter() - t0, "missing": len(rows)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--voters", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--base-lookups", type=int, default=100,
+                        help="lookups on the unindexed schema, where each one is a full table scan")
+    parser.add_argument("--without-coin", type=int, default=100, help="every Nth voter has no coin")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_schema_")
+    import db
+    db.configure(os.path.join(workdir, "database.db"))
+    import schema
+
+    results = {"voters": args.voters, "lookups": args.lookups, "base_lookups": args.base_lookups}
+    base_step = schema.MIGRATIONS[0][2]
+    db.run_in_transaction(lambda conn: (base_step(conn.cursor()), conn.execute("PRAGMA user_version=1")))
+    t0 = time.perf_counter()
+    populate(db, args.voters, args.without_coin)
+    results["populate_seconds"] = time.perf_counter() - t0
+
+    print("Timing base schema (no indexes)...")
+    results["base"] = {"coin_lookup": time_lookups(db, args.voters, args.base_lookups),
+                       "missing_coin_scan": time_missing_coin_scan(db)}
+
+    print("Applying index migration...")
+    results["index_build_seconds"] = _timed(lambda: schema.migrate_schema(target=2))
+
+    print("Timing indexed schema...")
+    results["indexed"] = {"coin_lookup": time_lookups(db, args.voters, args.lookups),
+                          "missing_coin_scan": time_missing_coin_scan(db)}
+    results["indexed"]["backfill_migration_seconds"] = _timed(lambda: schema.migrate_schema(target=3))
+    # What every later boot pays: reading user_version and finding nothing to do
+    results["indexed"]["second_boot_migrate_seconds"] = _timed(schema.migrate_schema)
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
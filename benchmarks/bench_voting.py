@@ -0,0 +1,259 @@
+"""Voting benchmark: register/login/vote throughput and chain costs by chain size.
+
+Runs the real Flask app offline through its test client against a throwaway
+database and block log. Synthetic voters are created with the app's own
+credential helpers. Two parts:
+
+  flow   register, log in and vote N voters over HTTP (optionally from several
+         client threads) and report throughput and latency percentiles per step
+  chain  for each chain size, write a synthetic chain and time a cold load
+         (full log replay), a warm load (from the startup snapshot), an
+         incremental validity check, a full audit, the tally, and the admin
+         dashboard / ledger page requests
+
+    python benchmarks/bench_voting.py --voters 2000 --threads 4 --out bench_voting.json
+    python benchmarks/bench_voting.py --skip-flow --chain-sizes 10000,100000,1000000
+    python benchmarks/bench_voting.py --voters 2000 --threads 8 --shards 4 --chain-sizes ""
+"""
+import argparse, json, os, sys, tempfile, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CANDIDATES = ("Candidate A", "Candidate B", "Candidate C")
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def _summary(samples, seconds, errors=0):
+    if not samples:
+        return {"count": 0, "errors": errors}
+    return {"count": len(samples), "errors": errors, "seconds": round(seconds, 3),
+            "per_second": round(len(samples) / max(seconds, 1e-9), 1),
+            "p50_ms": round(_percentile(samples, 50), 3), "p90_ms": round(_percentile(samples, 90), 3),
+            "p99_ms": round(_percentile(samples, 99), 3), "max_ms": round(max(samples), 3)}
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def _run_threads(app, voter_ids, threads, step, prepare=None, finish=None):
+    """Time step(client, voter_id) for every voter, spread over client threads; the
+    untimed prepare/finish hooks run around it. Returns (latencies_ms, wall_seconds, errors)."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(ids):
+        client = app.test_client()
+        local, bad = [], 0
+        for vid in ids:
+            if prepare:
+                prepare(client, vid)
+            t0 = time.perf_counter()
+            ok = step(client, vid)
+            local.append((time.perf_counter() - t0) * 1000.0)
+            bad += 0 if ok else 1
+            if finish:
+                finish(client, vid)
+        with lock:
+            latencies.extend(local)
+            errors[0] += bad
+
+    shards = [voter_ids[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(s,)) for s in shards if s]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies, time.perf_counter() - t0, errors[0]
+
+
+def bench_flow(app_module, voters, threads, preload):
+    """register -> login -> vote over HTTP, each voter on its own session."""
+    import db
+    from credentials import hash_password, generate_anonymous_token, generate_coin_id
+    app = app_module.app
+    ledger = app_module.ledger
+    results = {"voters": voters, "threads": threads, "preloaded_voters": preload, "shards": ledger.count,
+               "block_batch_size": app_module.blockchain.batch_size}
+
+    if preload:
+        # Background electorate, inserted directly with the same helpers /register uses
+        def insert(conn):
+            for i in range(preload):
+                hashed_pwd, salt = hash_password("pw")
+                vid = f"PRE{i:09d}"
+                conn.execute("INSERT INTO voters(voter_id,name,password,salt,anonymous_token,aadhaar_verified) VALUES (?,?,?,?,?,1)",
+                             (vid, "bench", hashed_pwd, salt, generate_anonymous_token()))
+                conn.execute("INSERT INTO coins(coin_id, voter_id, spent) VALUES (?,?,0)", (generate_coin_id(), vid))
+        results["preload_seconds"] = round(_timed(lambda: db.run_in_transaction(insert))[0], 3)
+
+    voter_ids = [f"BENCH{i:09d}" for i in range(voters)]
+    sessions = {}
+
+    def register(client, vid):
+        # Spread voters over 64 constituencies, and so over the ledger shards
+        r = client.post("/register", data={"name": "bench", "voter_id": vid, "password": "pw-" + vid,
+                                           "constituency": f"Constituency {int(vid[5:]) % 64}"})
+        return r.status_code == 302
+
+    def login(client, vid):
+        r = client.post("/voter", data={"voter_id": vid, "password": "pw-" + vid})
+        return r.status_code == 302
+
+    def save_session(client, vid):
+        # Each client thread serves many voters; keep each voter's login session for the vote step
+        with client.session_transaction() as s:
+            sessions[vid] = dict(s)
+
+    def restore_session(client, vid):
+        with client.session_transaction() as s:
+            s.clear()
+            s.update(sessions.get(vid, {}))
+
+    def vote(client, vid):
+        r = client.post("/vote", data={"candidate": CANDIDATES[int(vid[5:]) % len(CANDIDATES)]})
+        return r.status_code == 302
+
+    height_before = ledger.get_height()
+    steps = (("register", register, None, None),
+             ("login", login, None, save_session),
+             ("vote", vote, restore_session, None))
+    for name, step, prepare, finish in steps:
+        print(f"Timing {name} for {voters} voters on {threads} thread(s)...", flush=True)
+        latencies, seconds, errors = _run_threads(app, voter_ids, threads, step, prepare, finish)
+        results[name] = _summary(latencies, seconds, errors)
+    # Votes are sealed by the background ledger writer; wait for it to catch up
+    t0 = time.perf_counter()
+    for writer in app_module.ledger_writers:
+        writer.flush()
+    results["ledger_drain_seconds"] = round(time.perf_counter() - t0, 3)
+    results["blocks_added"] = ledger.get_height() - height_before
+    results["blocks_per_shard"] = [shard.get_height() for shard in ledger.shards]
+    results["chain_valid"] = ledger.is_valid()
+    return results
+
+
+def build_chain(path, blocks, validators, threshold):
+    """Write a valid chain of ``blocks`` single-ballot blocks straight to a block log."""
+    from blockchain import hash_header, sign
+    from chain_store import BlockLogStore
+    signers = validators[:threshold]
+    base = time.time() - blocks
+
+    def generate():
+        prev = "0"
+        for i in range(blocks + 1):
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(base + i))
+            if i == 0:
+                data = {"voter_id": "0", "vote": "Genesis Block"}
+            else:
+                data = {"anonymous_token": f"ANON_{i:012d}", "vote": CANDIDATES[i % len(CANDIDATES)],
+                        "coin_id": f"COIN_{i:016X}"}
+            header = {"version": "1", "index": i, "timestamp": ts, "data": data, "previous_hash": prev}
+            h = hash_header(header)
+            block = dict(header)
+            block["author"] = validators[i % len(validators)]["id"]
+            block["signatures"] = [{"validator": v["id"], "sig": sign(v["secret"], h)} for v in signers]
+            block["required_signatures"] = threshold
+            block["hash"] = h
+            prev = h
+            yield block
+
+    for suffix in ("snapshot", "idx", "checkpoint"):
+        if os.path.exists(f"{path}.{suffix}"):
+            os.remove(f"{path}.{suffix}")
+    BlockLogStore(path).compact(generate())
+
+
+def bench_chain(app_module, workdir, size, page_requests):
+    from blockchain import Blockchain
+    from shards import ShardedLedger
+    path = os.path.join(workdir, f"chain_{size}.log")
+    legacy = os.path.join(workdir, "none.json")
+    ref, ref_ledger = app_module.blockchain, app_module.ledger
+    out = {"blocks": size}
+    print(f"Building a {size}-block chain...", flush=True)
+    out["build_seconds"] = round(_timed(lambda: build_chain(path, size, ref.validators, ref.threshold))[0], 3)
+
+    seconds, bc = _timed(lambda: Blockchain(log_path=path, legacy_path=legacy))
+    out["cold_load_seconds"] = round(seconds, 3)
+    out["first_validate_seconds"] = round(_timed(bc.is_valid)[0], 3)
+    bc.close()
+
+    seconds, bc = _timed(lambda: Blockchain(log_path=path, legacy_path=legacy))
+    out["warm_load_seconds"] = round(seconds, 3)
+    out["incremental_validate_seconds"] = round(_timed(bc.is_valid)[0], 6)
+    seconds, report = _timed(bc.audit)
+    out["full_audit"] = {"seconds": round(seconds, 3), "valid": report["valid"],
+                         "workers": report["workers"], "ranges": report["ranges"]}
+    seconds, tally = _timed(bc.get_tally)
+    out["tally_seconds"] = round(seconds, 6)
+    out["tally_votes"] = sum(tally.values())
+
+    bc.close()
+    # Serve the admin pages from this chain, as a one-shard ledger
+    ledger = ShardedLedger(count=1, log_path=path)
+    bc = ledger.shards[0]
+    app_module.blockchain, app_module.ledger = bc, ledger
+    try:
+        client = app_module.app.test_client()
+        with client.session_transaction() as s:
+            s["admin"] = "admin"
+        for name, url in (("admin_dashboard", "/admin/dashboard"), ("ledger_page", "/admin/api/ledger")):
+            samples, errors = [], 0
+            t0 = time.perf_counter()
+            for _ in range(page_requests):
+                t1 = time.perf_counter()
+                errors += client.get(url).status_code != 200
+                samples.append((time.perf_counter() - t1) * 1000.0)
+            out[name] = _summary(samples, time.perf_counter() - t0, errors)
+    finally:
+        app_module.blockchain, app_module.ledger = ref, ref_ledger
+    ledger.close()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--voters", type=int, default=1000, help="voters to register, log in and vote over HTTP")
+    parser.add_argument("--threads", type=int, default=1, help="concurrent test clients for the flow")
+    parser.add_argument("--preload", type=int, default=0, help="extra voters inserted directly before the flow")
+    parser.add_argument("--chain-sizes", default="10000,100000,1000000",
+                        help="comma-separated chain sizes to benchmark (empty to skip)")
+    parser.add_argument("--page-requests", type=int, default=20, help="dashboard/ledger requests per chain size")
+    parser.add_argument("--shards", type=int, default=1, help="ledger shards (CHAIN_SHARDS) for the flow")
+    parser.add_argument("--skip-flow", action="store_true")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_voting_")
+    # app.py creates its Blockchain and reads these on import
+    os.environ["DB_FILE"] = os.path.join(workdir, "database.db")
+    os.environ["CHAIN_LOG_FILE"] = os.path.join(workdir, "blockchain.log")
+    os.environ["CHAIN_FILE"] = os.path.join(workdir, "blockchain.json")
+    os.environ["CHAIN_SHARDS"] = str(max(1, args.shards))
+    import app as app_module
+    app_module.init_db()
+
+    results = {"workdir": workdir, "started": time.strftime("%Y-%m-%d %H:%M:%S")}
+    if not args.skip_flow:
+        results["flow"] = bench_flow(app_module, args.voters, max(1, args.threads), args.preload)
+    sizes = [int(s) for s in args.chain_sizes.split(",") if s.strip()]
+    results["chain"] = [bench_chain(app_module, workdir, size, args.page_requests) for size in sizes]
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,286 @@
-import hashlib, json, time, os, hmac
+import hashlib, json, time, os, hmac, atexit, multiprocessing, threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from chain_store import BlockLogStore, LazyChain
+from ballot_index import BallotIndex, MAX_BLOCK_BALLOTS
+from blocks import Signature, intern_validator
+import merkle, metrics
+
+metrics.histogram("chain_header_hash_seconds", "Time to encode and hash one block header")
+metrics.histogram("chain_sign_seconds", "Time to compute one validator signature")
+metrics.histogram("chain_append_seconds", "Time to seal, sign and persist one block")
+metrics.histogram("chain_compact_seconds", "Time to compact the block log (save_to_file)")
+metrics.histogram("chain_load_seconds", "Time to load the chain from the block log")
+metrics.histogram("chain_validate_seconds", "Time spent in is_valid, by mode", buckets=metrics.DEFAULT_BUCKETS + (30.0, 60.0, 300.0))
+_FULL = (("mode", "full"),)
+_INCREMENTAL = (("mode", "incremental"),)
+
+
+def block_header(block):
+    """The signed part of a block (a dict or a blocks.Block)."""
+    return {
+        "version": block.get("version", "1"),
+        "index": block.get("index"),
+        "timestamp": block.get("timestamp"),
+        "data": block.get("data"),
+        "previous_hash": block.get("previous_hash"),
+    }
+
+
+_encode_sorted = json.JSONEncoder(sort_keys=True).encode
+
+
+def canonical_header(block):
+    """The bytes a block's hash is taken over. Identical to
+    ``json.dumps(block_header(block), sort_keys=True).encode()``, with the five header
+    keys written in their sorted order directly instead of building and sorting a dict."""
+    return ('{"data": %s, "index": %s, "previous_hash": %s, "timestamp": %s, "version": %s}' % (
+        _encode_sorted(block.get("data")),
+        _encode_sorted(block.get("index")),
+        _encode_sorted(block.get("previous_hash")),
+        _encode_sorted(block.get("timestamp")),
+        _encode_sorted(block.get("version", "1")),
+    )).encode()
+
+
+@metrics.timed("chain_header_hash_seconds")
+def hash_header(header):
+    return hashlib.sha256(canonical_header(header)).hexdigest()
+
+
+def header_digest(block):
+    """Hash of the block's header, recomputed from its contents. Cached on blocks.Block
+    objects, whose header fields do not change once loaded."""
+    cached = getattr(block, "header_hash", None)
+    if cached is None:
+        cached = hash_header(block)
+        if hasattr(block, "header_hash"):
+            block.header_hash = cached
+    return cached
+
+
+@metrics.timed("chain_sign_seconds")
+def sign(validator_secret, header_hash):
+    return hmac.new(validator_secret.encode(), header_hash.encode(), hashlib.sha256).hexdigest()
+
+
+def check_block_contents(prev_hash, curr, recomputed=None):
+    """The checks that need no validator secrets: linkage to ``prev_hash`` (None skips it),
+    the header hash and, for batched blocks, the Merkle root. Returns None or the reason."""
+    if prev_hash is not None and curr.get("previous_hash") != prev_hash:
+        return "previous_hash mismatch"
+    if (recomputed or header_digest(curr)) != curr.get("hash"):
+        return "header hash mismatch"
+    if "ballots" in curr:
+        ballots = curr["ballots"]
+        data = curr.get("data") or {}
+        if data.get("ballot_count") != len(ballots):
+            return "ballot count mismatch"
+        if merkle.merkle_root([merkle.leaf_hash(b) for b in ballots]) != data.get("merkle_root"):
+            return "merkle root mismatch"
+    return None
+
+
+def check_block(prev_hash, curr, secrets):
+    """Validate one block. ``prev_hash`` is the predecessor's hash (None skips the linkage
+    check) and ``secrets`` maps validator id -> secret. Returns None if valid, else the reason."""
+    recomputed = header_digest(curr)
+    reason = check_block_contents(prev_hash, curr, recomputed)
+    if reason:
+        return reason
+    sigs = curr.get("signatures", [])
+    required = curr.get("required_signatures", 1)
+    if len(sigs) < required:
+        return "not enough signatures"
+    valid_count = 0
+    for s in sigs:
+        secret = secrets.get(s.get("validator"))
+        if secret is not None and hmac.compare_digest(sign(secret, recomputed), s.get("sig") or ""):
+            valid_count += 1
+    if valid_count < required:
+        return "not enough valid signatures"
+    return None
+
+
+def block_ballots(block):
+    """The ballots recorded in a block: the block data itself for version 1 blocks."""
+    if "ballots" in block:
+        return block["ballots"]
+    if block.get("index") == 0:
+        return []
+    return [block.get("data") or {}]
+
+
+def count_votes(block, tally, buckets):
+    """Add a block's ballots to ``tally`` (candidate -> votes) and ``buckets`` (hour -> tally)."""
+    # Hourly buckets, e.g. "2024-05-01 09:00"
+    bucket = (block.get("timestamp") or "")[:13] + ":00"
+    for ballot in block_ballots(block):
+        cand = ballot.get("vote")
+        if not cand:
+            continue
+        tally[cand] = tally.get(cand, 0) + 1
+        counts = buckets.setdefault(bucket, {})
+        counts[cand] = counts.get(cand, 0) + 1
+
+
+def load_validators():
+    """The PoA validator set; secrets come from POA_*_SECRET environment variables."""
+    v = []
+    # Core constitutional/oversight bodies
+    v.append({"id": "eci", "role": "Election Commission of India (ECI)", "pub": "eci_pub", "secret": os.environ.get("POA_ECI_SECRET", "eci_secret")})
+    v.append({"id": "judicial", "role": "Judicial Oversight Panel (High Court–nominated)", "pub": "judicial_pub", "secret": os.environ.get("POA_JUDICIAL_SECRET", "judicial_secret")})
+    v.append({"id": "observer", "role": "Accredited Independent Observers (NGO/CSO)", "pub": "observer_pub", "secret": os.environ.get("POA_OBSERVER_SECRET", "observer_secret")})
+    # Technical and independent assurance
+    v.append({"id": "nic", "role": "National Informatics Centre / CERT-In", "pub": "nic_pub", "secret": os.environ.get("POA_NIC_SECRET", "nic_secret")})
+    v.append({"id": "academia", "role": "Academic Consortium (IIT/IIIT/NIT)", "pub": "academia_pub", "secret": os.environ.get("POA_ACADEMIA_SECRET", "academia_secret")})
+    v.append({"id": "auditor", "role": "Independent External Audit Firm Pool", "pub": "auditor_pub", "secret": os.environ.get("POA_AUDITOR_SECRET", "auditor_secret")})
+    # Federal balance via rotating state pool
+    v.append({"id": "state_pool", "role": "State Election Commission (Rotating Pool)", "pub": "state_pub", "secret": os.environ.get("POA_STATE_SECRET", "state_secret")})
+    return v
+
+
+def configured_threshold(validators):
+    """Signatures required per block: POA_THRESHOLD, by default 5 (a majority with fewer validators)."""
+    # Default higher quorum for production realism
+    default_threshold = 5 if len(validators) >= 5 else max(1, (len(validators) // 2) + 1)
+    try:
+        env_thr = int(os.environ.get("POA_THRESHOLD", str(default_threshold)))
+    except Exception:
+        env_thr = default_threshold
+    return max(1, min(env_thr, len(validators)))
+
+
+def _audit_context():
+    """Start method for audit worker processes: fork where available. Workers only run
+    _audit_range, and the locks it takes (metrics) are reset in a forked child; spawn or
+    forkserver would instead re-import the app's __main__ module, opening the ledger again."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("fork" if "fork" in methods else None)
+
+
+def _audit_range(log_path, first_index, start_byte, end_byte, overlay, secrets):
+    """Audit worker: verify the blocks whose records lie in [start_byte, end_byte) of the log.
+
+    Linkage is checked within the range only; the caller compares the returned first
+    previous_hash with the last hash of the range before. Returns
+    (failure, first_previous_hash, last_hash, blocks_read), failure being None or (index, reason).
+    """
+    idx = first_index
+    first_prev = last_hash = None
+    with open(log_path, "rb") as f:
+        f.seek(start_byte)
+        pos = start_byte
+        for line in f:
+            if pos >= end_byte:
+                break
+            pos += len(line)
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                return (idx, "unreadable block record"), first_prev, last_hash, idx - first_index
+            if rec.get("t") != "b":
+                continue  # late signatures arrive through ``overlay``
+            block = rec.get("block") or {}
+            sigs = block.setdefault("signatures", [])
+            for sig in overlay.get(idx, ()):
+                if not any(s.get("validator") == sig.get("validator") for s in sigs):
+                    sigs.append(sig)
+            if idx == first_index:
+                first_prev = block.get("previous_hash")
+            if idx > 0:
+                reason = check_block(last_hash if idx > first_index else None, block, secrets)
+                if reason:
+                    return (idx, reason), first_prev, last_hash, idx - first_index
+            last_hash = block.get("hash")
+            idx += 1
+    return None, first_prev, last_hash, idx - first_index
+
 
 class Blockchain:
-    def __init__(self):
+    def __init__(self, log_path=None, legacy_path=None):
         print("✅ Blockchain initialized")
-        self.chain = []
+        # Legacy pretty-printed chain file (read-only import; "" for none) and the append-only block log
+        self.legacy_path = legacy_path if legacy_path is not None else os.environ.get("CHAIN_FILE", "blockchain.json")
+        self.store = BlockLogStore(log_path or os.environ.get("CHAIN_LOG_FILE", "blockchain.log"))
+        # Blocks are read from the log on access; see chain_store.LazyChain
+        self.chain = LazyChain(self.store)
+        # A startup snapshot is written every CHAIN_SNAPSHOT_EVERY blocks and on shutdown
+        try:
+            self.snapshot_every = max(1, int(os.environ.get("CHAIN_SNAPSHOT_EVERY", "1000")))
+        except Exception:
+            self.snapshot_every = 1000
+        self._since_snapshot = 0
+        self._needs_migration = False
+        # Per validator: every block below this height carries its signature
+        self._signed_upto = {}
+        # Anonymous token / coin id -> block; blocks below _index_pending[1] may still be
+        # waiting for the background indexer (see _start_ballot_index)
+        self.ballot_index = BallotIndex()
+        self._index_live = False
+        self._index_pending = None
+        self._reset_checkpoint()
+        # Running vote counts, kept in step with the chain by add_block/load_from_file
+        self._tally = {}
+        self._tally_buckets = {}
         self.validators = self._load_validators()
-        # Default higher quorum for production realism; can be overridden via POA_THRESHOLD
-        default_threshold = 5 if len(self.validators) >= 5 else max(1, (len(self.validators) // 2) + 1)
+        self._validators_by_id = {v["id"]: v for v in self.validators}
+        self._secrets = {v["id"]: v["secret"] for v in self.validators}
+        # Blocks refer to validators by their index in this order
+        for v in self.validators:
+            intern_validator(v["id"])
+        # Full audits verify AUDIT_RANGE_SIZE-block ranges on AUDIT_WORKERS processes
         try:
-            env_thr = int(os.environ.get("POA_THRESHOLD", str(default_threshold)))
+            self.audit_workers = max(1, int(os.environ.get("AUDIT_WORKERS", str(os.cpu_count() or 1))))
         except Exception:
-            env_thr = default_threshold
-        self.threshold = max(1, min(env_thr, len(self.validators)))
-        self.load_from_file()
-        if not self.chain:
-            self.create_genesis_block()
-            self.save_to_file()
-        else:
-            # Migrate existing blocks to new required_signatures and top up signatures as needed
-            self._migrate_required_signatures()
-            self.save_to_file()
+            self.audit_workers = os.cpu_count() or 1
+        try:
+            self.audit_range_size = max(1, int(os.environ.get("AUDIT_RANGE_SIZE", "5000")))
+        except Exception:
+            self.audit_range_size = 5000
+        # Where the last validity check failed: {"index", "reason"}, or None
+        self.last_failure = None
+        self.threshold = configured_threshold(self.validators)
+        # Validators listed in POA_REMOTE_VALIDATORS co-sign from their own node processes
+        # (see replication.py), so new blocks are signed here only by the others
+        remote = {x.strip() for x in os.environ.get("POA_REMOTE_VALIDATORS", "").split(",") if x.strip()}
+        self._local_signers = [v for v in self.validators if v["id"] not in remote]
+        if len(self._local_signers) < self.threshold:
+            print("⚠ POA_REMOTE_VALIDATORS leaves too few local signers for the threshold; signing with all validators")
+            self._local_signers = list(self.validators)
+        # Called with the index of every block added to self.chain, here or by another process
+        self._block_listeners = []
+        # Batched block production: the ledger writer seals every BLOCK_BATCH_SIZE ballots or
+        # BLOCK_BATCH_MS milliseconds into one block committing to them by Merkle root (see
+        # append_ballots). 1 = one block per ballot.
+        try:
+            self.batch_size = max(1, int(os.environ.get("BLOCK_BATCH_SIZE", "1")))
+        except Exception:
+            self.batch_size = 1
+        if self.batch_size > MAX_BLOCK_BALLOTS:
+            # The ballot index can only address this many ballots within one block
+            print(f"⚠ BLOCK_BATCH_SIZE is capped at {MAX_BLOCK_BALLOTS}")
+            self.batch_size = MAX_BLOCK_BALLOTS
+        try:
+            self.batch_ms = max(1, int(os.environ.get("BLOCK_BATCH_MS", "500")))
+        except Exception:
+            self.batch_ms = 500
+        self._lock = threading.RLock()
+        # Other worker processes may be starting up or appending at the same time
+        with self._lock, self.store.exclusive():
+            self.load_from_file()
+            if not self.chain:
+                self.create_genesis_block()
+            elif self._needs_migration:
+                # Migrate existing blocks to new required_signatures and top up signatures as needed
+                self._migrate_required_signatures()
+                self._save_checkpoint()
+            self._save_snapshot()
+        # Only once the lock and the loaded chain exist can close() run
+        atexit.register(self.close)
 
     def _load_validators(self):
-        v = []
-        # Core constitutional/oversight bodies
-        v.append({"id": "eci", "role": "Election Commission of India (ECI)", "pub": "eci_pub", "secret": os.environ.get("POA_ECI_SECRET", "eci_secret")})
-        v.append({"id": "judicial", "role": "Judicial Oversight Panel (High Court–nominated)", "pub": "judicial_pub", "secret": os.environ.get("POA_JUDICIAL_SECRET", "judicial_secret")})
-        v.append({"id": "observer", "role": "Accredited Independent Observers (NGO/CSO)", "pub": "observer_pub", "secret": os.environ.get("POA_OBSERVER_SECRET", "observer_secret")})
-        # Technical and independent assurance
-        v.append({"id": "nic", "role": "National Informatics Centre / CERT-In", "pub": "nic_pub", "secret": os.environ.get("POA_NIC_SECRET", "nic_secret")})
-        v.append({"id": "academia", "role": "Academic Consortium (IIT/IIIT/NIT)", "pub": "academia_pub", "secret": os.environ.get("POA_ACADEMIA_SECRET", "academia_secret")})
-        v.append({"id": "auditor", "role": "Independent External Audit Firm Pool", "pub": "auditor_pub", "secret": os.environ.get("POA_AUDITOR_SECRET", "auditor_secret")})
-        # Federal balance via rotating state pool
-        v.append({"id": "state_pool", "role": "State Election Commission (Rotating Pool)", "pub": "state_pub", "secret": os.environ.get("POA_STATE_SECRET", "state_secret")})
-        return v
+        return load_validators()
 
     def _block_header(self, index, timestamp, data, previous_hash, version="1"):
         return {
@@ -45,11 +292,10 @@ class Blockchain:
         }
 
     def _hash_header(self, header):
-        encoded = json.dumps(header, sort_keys=True).encode()
-        return hashlib.sha256(encoded).hexdigest()
+        return hash_header(header)
 
     def _sign(self, validator_secret, header_hash):
-        return hmac.new(validator_secret.encode(), header_hash.encode(), hashlib.sha256).hexdigest()
+        return sign(validator_secret, header_hash)
 
     def _verify(self, validator_secret, header_hash, signature):
         expected = self._sign(validator_secret, header_hash)
@@ -68,65 +314,491 @@ class Blockchain:
         block["signatures"] = signatures
         block["required_signatures"] = self.threshold
         block["hash"] = header_hash
-        self.chain.append(block)
+        self._persist_block(block, header_hash)
 
     def get_last_block(self):
         return self.chain[-1]
 
+    def get_height(self):
+        return len(self.chain)
+
+    def get_blocks(self, start, end):
+        """Blocks with start <= index < end, clamped to the chain, as JSON-ready dicts."""
+        start = max(0, start)
+        end = min(len(self.chain), end)
+        return [b.to_dict() for b in self.chain[start:end]] if start < end else []
+
     def add_block(self, data):
+        """Append a block holding a single ballot (block version 1). Returns its index."""
+        with self._lock:
+            return self._append_block(data)
+
+    def add_block_if(self, make_data):
+        """Append a version 1 block holding make_data(last_block), unless it returns None.
+        The call and the append happen under the write lock, so processes racing to add
+        the same block cannot both add it. Returns the new block's index, or None."""
+        with self.write_lock():
+            data = make_data(self.get_last_block())
+            return None if data is None else self._append_block_locked(data, "1", None)
+
+    @staticmethod
+    def _ballot_block_data(ballots):
+        leaves = [merkle.leaf_hash(b) for b in ballots]
+        return {"merkle_root": merkle.merkle_root(leaves), "ballot_count": len(ballots)}
+
+    def _append_block(self, data, version="1", ballots=None):
+        with self.store.exclusive():
+            # Another worker process may have extended the chain since we last looked
+            self.refresh()
+            return self._append_block_locked(data, version, ballots)
+
+    @contextmanager
+    def write_lock(self):
+        """Hold this process's chain lock and the log's inter-process write lock, caught up
+        with other writers, so a caller can check and append as one step."""
+        with self._lock, self.store.exclusive():
+            self.refresh()
+            yield
+
+    def append_ballots(self, items, claim=None, record=None):
+        """Seal (key, ballot) pairs onto the chain under the write lock: one block per ballot,
+        or batched blocks of up to batch_size ballots when batching is on.
+
+        ``claim(items, height)`` runs under the lock before anything is written and returns
+        the pairs to append (e.g. after claiming their database rows); ``record(placed)``
+        receives [(key, block_index)] once the new blocks are fsynced, before the lock is
+        released.
+        """
+        with self.write_lock():
+            if claim is not None:
+                items = claim(items, len(self.chain))
+            placed = []
+            if self.batch_size > 1:
+                for i in range(0, len(items), self.batch_size):
+                    chunk = items[i:i + self.batch_size]
+                    ballots = [ballot for _, ballot in chunk]
+                    index = self._append_block_locked(self._ballot_block_data(ballots), "2", ballots)
+                    placed.extend((key, index) for key, _ in chunk)
+            else:
+                for key, ballot in items:
+                    placed.append((key, self._append_block_locked(ballot, "1", None)))
+            if record is not None and placed:
+                # What record() writes must not point at blocks a power loss could still take back
+                self.store.sync(force=True)
+                record(placed)
+        return placed
+
+    def find_ballots(self, coin_ids, start=0):
+        """Block index of each given coin id found on the chain at or after block ``start``."""
+        wanted = set(coin_ids)
+        found = {}
+        for i in range(max(0, start), len(self.chain)):
+            for ballot in self.block_ballots(self.chain[i]):
+                coin = ballot.get("coin_id")
+                if coin in wanted:
+                    found[coin] = i
+        return found
+
+    @metrics.timed("chain_append_seconds")
+    def _append_block_locked(self, data, version, ballots):
         last = self.get_last_block()
         index = len(self.chain)
         ts = time.strftime("%Y-%m-%d %H:%M:%S")
-        header = self._block_header(index, ts, data, last["hash"])
+        header = self._block_header(index, ts, data, last["hash"], version=version)
         header_hash = self._hash_header(header)
         author = self.validators[index % len(self.validators)]["id"]
         signatures = []
-        for v in self.validators:
+        for v in self._local_signers:
             sig = self._sign(v["secret"], header_hash)
             signatures.append({"validator": v["id"], "sig": sig})
             if len(signatures) >= self.threshold:
                 break
         block = dict(header)
+        if ballots is not None:
+            block["ballots"] = ballots
         block["author"] = author
         block["signatures"] = signatures
         block["required_signatures"] = self.threshold
         block["hash"] = header_hash
-        self.chain.append(block)
-        self.save_to_file()
+        self._persist_block(block, header_hash)
         print(f"✅ Block added: {block['index']}")
+        return index
 
-    def is_valid(self):
-        for i in range(1, len(self.chain)):
-            prev = self.chain[i - 1]
-            curr = self.chain[i]
-            if curr.get("previous_hash") != prev.get("hash"):
-                return False
-            header = {
-                "version": curr.get("version", "1"),
-                "index": curr.get("index"),
-                "timestamp": curr.get("timestamp"),
-                "data": curr.get("data"),
-                "previous_hash": curr.get("previous_hash"),
-            }
-            recomputed = self._hash_header(header)
-            if recomputed != curr.get("hash"):
+    def _persist_block(self, block, header_hash):
+        offset = self.store.append_block(block)
+        self.chain.append(block, offset).header_hash = header_hash
+        self._count_vote(block)
+        self._index_block(len(self.chain) - 1, block)
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self._save_snapshot()
+        self._notify_block(len(self.chain) - 1)
+
+    def add_block_listener(self, fn):
+        """Call fn(index) whenever a block is added, including blocks picked up from other
+        worker processes by refresh(). Runs under the chain lock, so fn must be quick."""
+        self._block_listeners.append(fn)
+
+    def _notify_block(self, index):
+        for fn in self._block_listeners:
+            try:
+                fn(index)
+            except Exception as e:
+                print(f"⚠ Block listener failed: {e}")
+
+    def refresh(self):
+        """Pick up blocks and signatures appended to the log by other worker processes.
+
+        Costs one stat() when nothing changed. Falls back to a full reload (and drops the
+        validation checkpoint) if the log was compacted, truncated or rewritten.
+        """
+        with self._lock:
+            if not self.store.changed_externally():
+                return
+            records = None if self.store.needs_reload() else self.store.read_new()
+            if records is not None and all(self._apply_record(off, r) for off, r in records):
+                return
+            print("⚠ Block log changed on disk; reloading and re-validating")
+            self.load_from_file()
+            self._reset_checkpoint()
+
+    def _apply_record(self, offset, rec, check=True):
+        """Apply one log record read back from the log (at startup, or written by another
+        process). With check=True, returns False if a block does not extend our tip."""
+        kind = rec.get("t")
+        if kind == "b":
+            block = rec.get("block") or {}
+            if check and (block.get("index") != len(self.chain) or
+                          (len(self.chain) and block.get("previous_hash") != self.chain[-1].get("hash"))):
                 return False
-            sigs = curr.get("signatures", [])
-            if len(sigs) < curr.get("required_signatures", 1):
+            self.chain.append(block, offset)
+            self._count_vote(block)
+            self._index_block(len(self.chain) - 1, block)
+            if block.get("required_signatures") != self.threshold or len(block.get("signatures", [])) < self.threshold:
+                self._needs_migration = True
+            self._notify_block(len(self.chain) - 1)
+        elif kind == "s":
+            idx = rec.get("i")
+            if not isinstance(idx, int) or not 0 <= idx < len(self.chain):
+                return not check
+            self.chain.add_signature(idx, {"validator": rec.get("v"), "sig": rec.get("sig")})
+            self._mark_dirty(idx)
+        return True
+
+    @staticmethod
+    def block_ballots(block):
+        """The ballots recorded in a block: the block data itself for version 1 blocks."""
+        return block_ballots(block)
+
+    # ----------------- Ballot index and receipts -----------------
+    def _index_block(self, index, block):
+        if self._index_live:
+            self.ballot_index.add_block(index, block_ballots(block))
+
+    def _start_ballot_index(self):
+        """Load the saved ballot index and index the blocks it does not cover in a background
+        thread, so startup does not wait for a pass over the whole chain."""
+        height = len(self.chain)
+        path = self.store.meta_path("ballots")
+        loaded = BallotIndex.load(path)
+        start = 0
+        if loaded is not None:
+            index, start, tip = loaded
+            if not (0 <= start <= height and (start == 0 or self.chain[start - 1].get("hash") == tip)):
+                loaded = None
+        if loaded is None:
+            # Two keys per ballot at half load
+            index, start = BallotIndex(capacity=4 * max(self.get_vote_count(), height)), 0
+        self.ballot_index = index
+        self._index_live = True
+        self._index_pending = (start, height) if start < height else None
+        if start < height:
+            threading.Thread(target=self._index_backlog, args=(index, start, height),
+                             name="ballot-index", daemon=True).start()
+
+    def _index_backlog(self, index, start, end):
+        offsets = self.chain.offsets
+        i = start
+        try:
+            for block in self.store.iter_blocks(offsets[start]):
+                if i >= end or self.ballot_index is not index:
+                    break
+                index.add_block(i, block_ballots(block))
+                i += 1
+                self._index_pending = (i, end)
+        except Exception as e:
+            print(f"⚠ Ballot indexing stopped at block {i}: {e}")
+            return
+        if i < end or self.ballot_index is not index:
+            return
+        self._index_pending = None
+        print(f"✅ Ballot index covers all {end} blocks")
+        self._save_ballot_index()
+
+    def _save_ballot_index(self):
+        if self._index_pending is not None or not self._index_live:
+            return  # only a contiguous prefix of the chain can be saved
+        with self._lock:
+            index, height = self.ballot_index, len(self.chain)
+            tip = self.chain[-1].get("hash") if height else None
+        try:
+            index.save(self.store.meta_path("ballots"), height, tip)
+        except Exception as e:
+            print(f"Error saving ballot index: {e}")
+
+    def index_backlog(self):
+        """Blocks the background indexer still has to read (0 once the index is complete)."""
+        pending = self._index_pending
+        return pending[1] - pending[0] if pending else 0
+
+    def locate_ballot(self, token=None, coin_id=None):
+        """(block, position) of the ballot with this anonymous token or coin id, or None.
+
+        Answered from the ballot index; while the index is still being built, a small
+        backlog (up to 1000 blocks) is scanned directly. Check index_backlog() to tell
+        "not on the chain" from "not indexed yet".
+        """
+        field, value = ("anonymous_token", token) if token else ("coin_id", coin_id)
+        if not value:
+            return None
+        chain = self.chain
+        for i, pos in self.ballot_index.lookup(token=token, coin_id=None if token else coin_id):
+            if i < len(chain):
+                ballots = block_ballots(chain[i])
+                if pos < len(ballots) and ballots[pos].get(field) == value:
+                    return chain[i], pos
+        pending = self._index_pending
+        if pending and pending[1] - pending[0] <= 1000:
+            for i in range(pending[0], min(pending[1], len(chain))):
+                for pos, ballot in enumerate(block_ballots(chain[i])):
+                    if ballot.get(field) == value:
+                        return chain[i], pos
+        return None
+
+    def get_receipt(self, token=None, coin_id=None):
+        """Where a ballot landed, its inclusion proof and whether its block is properly linked
+        and signed, or None. Like the inclusion proof, it never includes the vote."""
+        found = self.locate_ballot(token, coin_id)
+        if found is None:
+            return None
+        block, pos = found
+        i = block.get("index")
+        height = len(self.chain)
+        reason = self._check_block(i) if i else None
+        receipt = self._inclusion_proof(block, pos)
+        receipt.update({
+            "timestamp": block.get("timestamp"),
+            "position": pos,
+            "confirmations": height - 1 - i,
+            "signatures": [s.get("validator") for s in block.get("signatures", [])],
+            "required_signatures": block.get("required_signatures"),
+            "block_valid": reason is None,
+            "reason": reason,
+            # Covered by the last full-chain validity check
+            "chain_verified": i < self._verified_height and i not in self._dirty,
+        })
+        return receipt
+
+    def get_inclusion_proof(self, token=None, coin_id=None):
+        """Locate a ballot by anonymous token or coin id and prove it is committed to by its block.
+
+        Returns None if the ballot is not (yet) on the chain. For batched blocks the proof is a
+        Merkle path to the block's merkle_root. Neither the ballot nor its leaf hash is returned:
+        anyone holding a token could otherwise read or guess the vote. The voter recomputes the
+        leaf from the ballot they cast (merkle.leaf_hash of its token, vote and coin id).
+        """
+        found = self.locate_ballot(token, coin_id)
+        return self._inclusion_proof(*found) if found else None
+
+    def _inclusion_proof(self, block, pos):
+        result = {
+            "block_index": block.get("index"),
+            "block_hash": block.get("hash"),
+        }
+        if "ballots" in block:
+            leaves = [merkle.leaf_hash(b) for b in self.block_ballots(block)]
+            result["merkle_root"] = block["data"].get("merkle_root")
+            result["proof"] = merkle.merkle_proof(leaves, pos)
+        return result
+
+    def _check_block(self, i):
+        """Validate block i against its predecessor. Returns None if valid, else the reason."""
+        return check_block(self.chain[i - 1].get("hash"), self.chain[i], self._secrets)
+
+    def is_valid(self, full=False):
+        """Validate the chain.
+
+        By default only blocks appended or re-signed since the last successful check are
+        verified; everything below the verified-height checkpoint is trusted. Pass
+        ``full=True`` for an auditor's full re-verification from genesis (see audit()).
+        Where a check fails is kept in ``last_failure``.
+        """
+        if full:
+            with metrics.timer("chain_validate_seconds", _FULL):
+                return self.audit()["valid"]
+        with metrics.timer("chain_validate_seconds", _INCREMENTAL), self._lock:
+            return self._is_valid_locked()
+
+    def _is_valid_locked(self):
+        self.refresh()
+        height = self._verified_height
+        if height > len(self.chain) or (height and self.chain[height - 1].get("hash") != self._verified_tip):
+            # Chain was rewritten beneath the checkpoint
+            self._reset_checkpoint()
+            height = self._verified_height
+        for i in sorted(self._dirty):
+            if 0 < i < height and self._fail(i, self._check_block(i)):
                 return False
-            valid_count = 0
-            for s in sigs:
-                vid = s.get("validator")
-                sig = s.get("sig")
-                val = next((x for x in self.validators if x["id"] == vid), None)
-                if not val:
-                    continue
-                if self._verify(val["secret"], recomputed, sig):
-                    valid_count += 1
-            if valid_count < curr.get("required_signatures", 1):
+        self._dirty.clear()
+        for i in range(max(height, 1), len(self.chain)):
+            if self._fail(i, self._check_block(i)):
                 return False
+        self.last_failure = None
+        if len(self.chain) != height:
+            self._verified_height = len(self.chain)
+            self._verified_tip = self.chain[-1].get("hash") if self.chain else None
+            self._save_checkpoint()
         return True
-    
+
+    def _fail(self, index, reason):
+        if reason is None:
+            return False
+        self.last_failure = {"index": index, "reason": reason}
+        return True
+
+    def audit(self, workers=None):
+        """Full audit: re-verify every block from genesis.
+
+        The chain is split into ranges of ``audit_range_size`` blocks that are read straight
+        from the log and verified on a process pool; previous_hash linkage across range
+        boundaries is checked here. Returns a report with the first failing block index
+        and reason.
+        """
+        workers = workers or self.audit_workers
+        started = time.perf_counter()
+        while True:
+            with self._lock:
+                self.refresh()
+                height = len(self.chain)
+                offsets = self.chain.offsets[:]
+                overlay = {i: list(sigs) for i, sigs in self.chain.overlay.items()}
+                end_byte = self.store.end_offset()
+                tip = self.chain[-1].get("hash") if height else None
+                dirty = set(self._dirty)
+                fp = self.store.fingerprint()
+            failure, ranges = self._audit_ranges(offsets, overlay, end_byte, workers)
+            # Compaction replaces the log and invalidates the offsets we read by; start again
+            now = self.store.fingerprint()
+            if fp and now and now[0] == fp[0]:
+                break
+        with self._lock:
+            if failure:
+                self.last_failure = {"index": failure[0], "reason": failure[1]}
+                self._reset_checkpoint()
+            else:
+                self.last_failure = None
+                if height and height <= len(self.chain) and self.chain[height - 1].get("hash") == tip:
+                    self._verified_height = height
+                    self._verified_tip = tip
+                    self._dirty -= dirty
+                    self._save_checkpoint()
+        return {
+            "valid": failure is None,
+            "height": height,
+            "first_invalid": failure[0] if failure else None,
+            "reason": failure[1] if failure else None,
+            "ranges": ranges,
+            "workers": min(workers, ranges) if ranges > 1 else 1,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    def _audit_ranges(self, offsets, overlay, end_byte, workers):
+        """Verify blocks [0, len(offsets)) in ranges; returns ((index, reason) or None, range count)."""
+        n = len(offsets)
+        size = self.audit_range_size
+        bounds = [(s, min(n, s + size)) for s in range(0, n, size)]
+        range_overlay = [{} for _ in bounds]
+        for i, sigs in overlay.items():
+            if 0 <= i < n:
+                range_overlay[i // size][i] = sigs
+        jobs = [(self.store.path, s, offsets[s], offsets[e] if e < n else end_byte, ov, self._secrets)
+                for (s, e), ov in zip(bounds, range_overlay)]
+        if len(jobs) > 1 and workers > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=_audit_context()) as pool:
+                results = list(pool.map(_audit_range, *zip(*jobs)))
+        else:
+            results = [_audit_range(*job) for job in jobs]
+        last_hash = None
+        for (s, e), (failure, first_prev, range_last, count) in zip(bounds, results):
+            if s > 0 and first_prev != last_hash:
+                return (s, "previous_hash mismatch"), len(bounds)
+            if failure:
+                return failure, len(bounds)
+            if count != e - s:
+                return (s + count, "block record missing from log"), len(bounds)
+            last_hash = range_last
+        return None, len(bounds)
+
+    def _reset_checkpoint(self):
+        self._verified_height = 0
+        self._verified_tip = None
+        self._dirty = set()
+
+    def _mark_dirty(self, index):
+        if index < self._verified_height:
+            self._dirty.add(index)
+
+    def _load_checkpoint(self):
+        """Restore the verified-height checkpoint if the log is byte-for-byte what it covered."""
+        self._reset_checkpoint()
+        cp = self.store.read_meta("checkpoint")
+        if not cp or cp.get("log") != self.store.fingerprint():
+            return
+        height = cp.get("height", 0)
+        if 0 < height <= len(self.chain) and self.chain[height - 1].get("hash") == cp.get("tip_hash"):
+            self._verified_height = height
+            self._verified_tip = cp.get("tip_hash")
+
+    def _save_checkpoint(self):
+        # Re-signed blocks still waiting for verification are excluded from the checkpoint
+        height = min([self._verified_height] + list(self._dirty))
+        if height <= 0:
+            return
+        try:
+            self.store.write_meta("checkpoint", {
+                "height": height,
+                "tip_hash": self.chain[height - 1].get("hash"),
+                "log": self.store.fingerprint(),
+            })
+        except Exception as e:
+            print(f"Error saving validation checkpoint: {e}")
+
+    def _count_vote(self, block):
+        count_votes(block, self._tally, self._tally_buckets)
+
+    def state_tag(self):
+        """A short string that changes whenever a block or a signature is added. Worker
+        processes that have caught up with the same log return the same tag, so it can
+        serve as an HTTP cache validator."""
+        with self._lock:
+            height = len(self.chain)
+            tip = self.chain[-1].get("hash") if height else ""
+            late = self.chain.overlay_size()
+            fp = self.store.fingerprint()
+        # The inode changes when the log is compacted and late signatures are folded into blocks
+        return f"{height}-{(tip or '')[:16]}-{late}-{fp[0] if fp else 0}-{self.threshold}"
+
+    def get_tally(self):
+        """Votes per candidate, in order of each candidate's first vote."""
+        return dict(self._tally)
+
+    def get_tally_buckets(self):
+        """Votes per candidate for each hour of polling, keyed by "YYYY-MM-DD HH:00"."""
+        return {b: dict(c) for b, c in self._tally_buckets.items()}
+
+    def get_vote_count(self):
+        return sum(self._tally.values())
+
     def get_validator_ids(self):
         return [v["id"] for v in self.validators]
 
@@ -134,98 +806,289 @@ class Blockchain:
         return [{"id": v.get("id"), "role": v.get("role", "")} for v in self.validators]
 
     def _block_header_from_block(self, block):
-        return {
-            "version": block.get("version", "1"),
-            "index": block.get("index"),
-            "timestamp": block.get("timestamp"),
-            "data": block.get("data"),
-            "previous_hash": block.get("previous_hash"),
-        }
+        return block_header(block)
 
     def _find_validator(self, validator_id):
-        return next((v for v in self.validators if v["id"] == validator_id), None)
+        return self._validators_by_id.get(validator_id)
 
     def has_signature(self, block, validator_id):
-        sigs = block.get("signatures", [])
-        return any(s.get("validator") == validator_id for s in sigs)
+        return block.has_signature(validator_id)
 
     def add_signature_to_block(self, index, validator_id):
-        if index < 0 or index >= len(self.chain):
-            return False
-        block = self.chain[index]
-        if self.has_signature(block, validator_id):
+        with self._lock, self.store.exclusive():
+            self.refresh()
+            if index < 0 or index >= len(self.chain):
+                return False
+            block = self.chain[index]
+            if self.has_signature(block, validator_id):
+                return True
+            v = self._find_validator(validator_id)
+            if not v:
+                return False
+            header_hash = header_digest(block)
+            sig = self._sign(v["secret"], header_hash)
+            self.chain.add_signature(index, {"validator": validator_id, "sig": sig})
+            self.store.append_signature(index, validator_id, sig)
+            self._mark_dirty(index)
             return True
-        v = self._find_validator(validator_id)
-        if not v:
-            return False
-        header = self._block_header_from_block(block)
-        header_hash = self._hash_header(header)
-        sig = self._sign(v["secret"], header_hash)
-        block.setdefault("signatures", []).append({"validator": validator_id, "sig": sig})
-        self.save_to_file()
-        return True
 
     def _migrate_required_signatures(self):
         """Ensure each block's required_signatures equals current threshold and has sufficient signatures.
-        This updates history for demo consistency.
+        This updates history for demo consistency. Blocks are streamed into a freshly compacted log,
+        so this only runs when loading found a block that needs it.
         """
-        for idx in range(len(self.chain)):
-            block = self.chain[idx]
-            # Set required_signatures to current threshold
-            block["required_signatures"] = self.threshold
-            sigs = block.setdefault("signatures", [])
-            # Top up signatures until threshold reached, using available validators
-            seen = set(s.get("validator") for s in sigs if s.get("validator"))
-            if len(sigs) >= self.threshold:
-                continue
-            header = self._block_header_from_block(block)
-            header_hash = self._hash_header(header)
-            for v in self.validators:
-                if len(sigs) >= self.threshold:
-                    break
-                if v["id"] in seen:
-                    continue
-                sig = self._sign(v["secret"], header_hash)
-                sigs.append({"validator": v["id"], "sig": sig})
-                seen.add(v["id"])
+        def migrated():
+            for idx, block in enumerate(self.chain):
+                # Set required_signatures to current threshold
+                if block.get("required_signatures") != self.threshold:
+                    self._mark_dirty(idx)
+                block.required_signatures = self.threshold
+                # Top up signatures until threshold reached, using available validators
+                if len(block.get("signatures", [])) < self.threshold:
+                    header_hash = header_digest(block)
+                    for v in self.validators:
+                        if len(block.get("signatures", [])) >= self.threshold:
+                            break
+                        if block.add_signature(Signature(v["id"], self._sign(v["secret"], header_hash))):
+                            self._mark_dirty(idx)
+                yield block
+        print("🔄 Migrating blocks to the current signature threshold...")
+        offsets = self.store.compact(migrated())
+        self.chain = LazyChain(self.store, offsets)
+        self._needs_migration = False
 
     def add_signature_latest(self, validator_id):
+        self.refresh()
         if not self.chain:
             return False
         return self.add_signature_to_block(len(self.chain) - 1, validator_id)
 
     def add_signature_all(self, validator_id):
         """Add the validator's signature to all blocks that lack it."""
+        result = self.sign_blocks(validator_id)
+        return result["signed"] if result else 0
+
+    def sign_blocks(self, validator_id, start=None, end=None):
+        """Batch co-signing: sign every block in [start, end) that lacks this validator's
+        signature. Without a start, resumes from the validator's signed-up-to watermark, so
+        only blocks added since its last batch are looked at.
+
+        The whole batch is appended to the log in one write and fsynced before returning.
+        Returns {"signed", "start", "end", "signed_upto"}, or None for an unknown validator.
+        """
         v = self._find_validator(validator_id)
         if not v:
-            return 0
-        count = 0
-        for idx in range(len(self.chain)):
-            block = self.chain[idx]
-            if self.has_signature(block, validator_id):
-                continue
-            header = self._block_header_from_block(block)
-            header_hash = self._hash_header(header)
-            sig = self._sign(v["secret"], header_hash)
-            block.setdefault("signatures", []).append({"validator": validator_id, "sig": sig})
-            count += 1
-        if count:
-            self.save_to_file()
-        return count
-    
+            return None
+        added = []
+        with self._lock, self.store.exclusive():
+            self.refresh()
+            height = len(self.chain)
+            upto = min(self._signed_upto.get(validator_id, 0), height)
+            start = upto if start is None else max(0, start)
+            end = height if end is None else min(end, height)
+            for idx in range(start, end):
+                block = self.chain[idx]
+                if block.has_signature(validator_id):
+                    continue
+                sig = self._sign(v["secret"], header_digest(block))
+                self.chain.add_signature(idx, {"validator": validator_id, "sig": sig})
+                added.append((idx, validator_id, sig))
+                self._mark_dirty(idx)
+            if added:
+                self.store.append_signatures(added)
+                self.store.sync(force=True)
+            # A batch that starts inside the signed prefix extends it
+            if start <= upto < end:
+                upto = end
+            self._signed_upto[validator_id] = upto
+        return {"signed": len(added), "start": start, "end": max(start, end), "signed_upto": upto}
+
+    def add_signatures(self, validator_id, sigs):
+        """Record co-signatures made elsewhere, e.g. by a validator node: ``sigs`` is a list
+        of (index, sig). Each is verified against the block's header hash before it is kept,
+        and the accepted ones are appended to the log in one fsynced write.
+        Returns {"accepted", "rejected", "signed_upto"}, or None for an unknown validator."""
+        v = self._find_validator(validator_id)
+        if not v:
+            return None
+        added, rejected = [], []
+        with self._lock, self.store.exclusive():
+            self.refresh()
+            height = len(self.chain)
+            for idx, sig in sigs:
+                if not isinstance(idx, int) or not 0 <= idx < height or not isinstance(sig, str):
+                    rejected.append(idx)
+                    continue
+                block = self.chain[idx]
+                if block.has_signature(validator_id):
+                    continue
+                if not self._verify(v["secret"], header_digest(block), sig):
+                    rejected.append(idx)
+                    continue
+                self.chain.add_signature(idx, {"validator": validator_id, "sig": sig})
+                added.append((idx, validator_id, sig))
+                self._mark_dirty(idx)
+            if added:
+                self.store.append_signatures(added)
+                self.store.sync(force=True)
+            # Extend the signed-up-to watermark over the blocks that now carry the signature
+            upto = min(self._signed_upto.get(validator_id, 0), height)
+            while upto < height and self.chain[upto].has_signature(validator_id):
+                upto += 1
+            self._signed_upto[validator_id] = upto
+        return {"accepted": len(added), "rejected": rejected, "signed_upto": upto}
+
+    def signed_upto(self, validator_id):
+        return self._signed_upto.get(validator_id, 0)
+
+    @metrics.timed("chain_compact_seconds")
     def save_to_file(self):
+        """Compact the block log, folding late signatures into their blocks, and snapshot it."""
         try:
-            with open("blockchain.json", "w") as f:
-                json.dump(self.chain, f, indent=2)
+            offsets = self.store.compact(iter(self.chain))
+            self.chain = LazyChain(self.store, offsets)
         except Exception as e:
             print(f"Error saving blockchain: {e}")
-    
+            return
+        self._save_snapshot()
+        self._save_checkpoint()
+
+    def _save_snapshot(self):
+        """Persist what a restart needs to skip replaying the log: block offsets (.idx),
+        tip, tally and the late signatures not yet folded into their blocks.
+        Callers hold the store's exclusive lock."""
+        if self.chain.overlay_size() > max(10000, len(self.chain) // 10):
+            # Too many late signatures to carry in the snapshot; fold them into the log
+            self.save_to_file()
+            return
+        fp = self.store.fingerprint()
+        if not fp or not len(self.chain):
+            return
+        try:
+            self.store.write_index(self.chain.offsets)
+            self.store.write_meta("snapshot", {
+                "height": len(self.chain),
+                "tip_hash": self.chain[-1].get("hash"),
+                "log": fp,
+                "log_offset": self.store.end_offset(),
+                "threshold": self.threshold,
+                "tally": self._tally,
+                "tally_buckets": self._tally_buckets,
+                "overlay": {str(k): v for k, v in self.chain.overlay.items()},
+                "signed_upto": self._signed_upto,
+            })
+            self._since_snapshot = 0
+        except Exception as e:
+            print(f"Error saving snapshot: {e}")
+        if self.ballot_index.unsaved > max(100000, len(self.chain) // 10):
+            self._save_ballot_index()
+
+    def _restore_snapshot(self):
+        """Adopt the startup snapshot if the log is unchanged since it was taken. Returns the
+        byte offset to resume reading the log from, or None to replay it from the start.
+
+        The full fingerprint must match: inode and size alone would accept a log whose
+        earlier records were rewritten in place. close() saves a fresh snapshot, so only
+        a crash (or another process appending after our last snapshot) costs a full replay.
+        """
+        snap = self.store.read_meta("snapshot")
+        fp = self.store.fingerprint()
+        if not snap or not fp or snap.get("log") != fp:
+            return None
+        if snap.get("threshold") != self.threshold:
+            return None
+        height = snap.get("height", 0)
+        offsets = self.store.read_index(height) if height else None
+        if offsets is None:
+            return None
+        chain = LazyChain(self.store, offsets, {int(k): v for k, v in snap.get("overlay", {}).items()})
+        try:
+            tip_hash = chain[-1].get("hash")
+        except Exception:
+            return None
+        if tip_hash != snap.get("tip_hash"):
+            return None
+        self.chain = chain
+        self._tally = snap.get("tally", {})
+        self._tally_buckets = snap.get("tally_buckets", {})
+        self._signed_upto = {vid: min(h, height) for vid, h in snap.get("signed_upto", {}).items()}
+        return snap.get("log_offset", 0)
+
+    @metrics.timed("chain_load_seconds")
     def load_from_file(self):
+        """Load the chain from the block log, or import a legacy blockchain.json.
+
+        When the startup snapshot still matches the log only the records appended after
+        it are read; historical blocks are then loaded lazily on access.
+        """
+        self.store.close_reader()
+        self.chain = LazyChain(self.store)
+        self._index_live = False
+        self._tally = {}
+        self._tally_buckets = {}
+        self._signed_upto = {}
+        self._needs_migration = False
         try:
-            if os.path.exists("blockchain.json"):
-                with open("blockchain.json", "r") as f:
-                    self.chain = json.load(f)
-                print(f"✅ Loaded existing blockchain with {len(self.chain)} blocks")
+            if self.store.exists():
+                start = self._restore_snapshot()
+                resumed = start is not None
+                try:
+                    for offset, rec in self.store.scan(start or 0):
+                        self._apply_record(offset, rec, check=False)
+                except ValueError:
+                    pass  # undecodable record: treat as a torn tail
+                self.store.truncate_tail()
+                self._load_checkpoint()
+                how = "from snapshot" if resumed else "by replaying the log"
+                print(f"✅ Loaded existing blockchain with {len(self.chain)} blocks ({how})")
+            elif self.legacy_path and os.path.exists(self.legacy_path):
+                # Legacy format; import it into the block log
+                with open(self.legacy_path, "r") as f:
+                    blocks = json.load(f)
+                print(f"✅ Loaded legacy blockchain with {len(blocks)} blocks from {self.legacy_path}")
+                offsets = self.store.compact(blocks)
+                self.chain = LazyChain(self.store, offsets)
+                for block in blocks:
+                    self._count_vote(block)
+                    if block.get("required_signatures") != self.threshold or len(block.get("signatures", [])) < self.threshold:
+                        self._needs_migration = True
         except Exception as e:
             print(f"Error loading blockchain: {e}")
-            self.chain = []
\ No newline at end of file
+            self.chain = LazyChain(self.store)
+        self._start_ballot_index()
+
+    def close(self):
+        """Flush the block log and persist the snapshot and validation checkpoint."""
+        with self._lock, self.store.exclusive():
+            self.refresh()
+            self.store.close()
+            self._save_snapshot()
+            self._save_checkpoint()
+            if self.ballot_index.unsaved:
+                self._save_ballot_index()
+
+
+class ChainReader:
+    """Read-only view of a block log for offline tools such as export_chain and reconcile.
+
+    Unlike Blockchain it never creates a log or a genesis block, migrates signatures,
+    compacts, truncates a torn tail or writes snapshots: the log and its sidecar files
+    are left exactly as they are. A missing log raises FileNotFoundError.
+    """
+
+    def __init__(self, log_path):
+        self.store = BlockLogStore(log_path)
+        if not self.store.exists():
+            raise FileNotFoundError(f"no block log at {log_path}")
+        self.chain = LazyChain.read_only(self.store)
+        self.validators = load_validators()
+        self.threshold = configured_threshold(self.validators)
+
+    def get_height(self):
+        return len(self.chain)
+
+    def get_blocks(self, start, end):
+        """Blocks with start <= index < end, clamped to the chain, as JSON-ready dicts."""
+        start = max(0, start)
+        end = min(len(self.chain), end)
+        return [b.to_dict() for b in self.chain[start:end]] if start < end else []
@@ -0,0 +1,209 @@
+"""Compact in-memory representation of blocks.
+
+Blocks read from the log are held as ``Block`` objects with ``__slots__`` rather
+than nested dicts: hashes and signatures are kept as raw 32-byte digests and
+validators as small integer indices into a process-wide table of validator IDs.
+A block still reads like the dict it was loaded from (``block.get("hash")``,
+``block["data"]``, ``"ballots" in block``) and ``to_dict()`` gives back the exact
+JSON form that is written to the log and served by the ledger API.
+"""
+import sys
+
+_MISSING = object()
+
+# Validator IDs, interned as indices in order of first appearance
+_VALIDATOR_IDS = []
+_VALIDATOR_INDEX = {}
+
+
+def intern_validator(validator_id):
+    """Index of a validator ID in the process-wide table (None stays None)."""
+    if validator_id is None:
+        return None
+    idx = _VALIDATOR_INDEX.get(validator_id)
+    if idx is None:
+        idx = len(_VALIDATOR_IDS)
+        _VALIDATOR_IDS.append(validator_id)
+        _VALIDATOR_INDEX[validator_id] = idx
+    return idx
+
+
+def validator_id(idx):
+    return None if idx is None else _VALIDATOR_IDS[idx]
+
+
+def _digest(value):
+    # Only canonical lowercase SHA-256 hex is stored raw, so to_dict() reproduces
+    # the original string exactly; anything else (e.g. the genesis "0") is kept as is
+    if isinstance(value, str) and len(value) == 64 and value == value.lower():
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _hex(value):
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def _intern_dict(d):
+    # Ballot dicts repeat the same few keys (and candidate names) in every block
+    if not isinstance(d, dict):
+        return d
+    return {sys.intern(k): (sys.intern(v) if k == "vote" and isinstance(v, str) else v) for k, v in d.items()}
+
+
+class Signature:
+    """One validator signature: validator index and raw HMAC-SHA256 digest."""
+    __slots__ = ("_validator", "_sig")
+
+    def __init__(self, validator, sig):
+        self._validator = intern_validator(validator)
+        self._sig = _digest(sig)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d.get("validator"), d.get("sig"))
+
+    @property
+    def validator(self):
+        return validator_id(self._validator)
+
+    @property
+    def validator_index(self):
+        return self._validator
+
+    @property
+    def sig(self):
+        return _hex(self._sig)
+
+    def get(self, key, default=None):
+        if key == "validator":
+            return self.validator
+        if key == "sig":
+            return self.sig
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def to_dict(self):
+        return {"validator": self.validator, "sig": self.sig}
+
+
+class Block:
+    """A block as held in memory. Fields a block was stored without stay absent."""
+    __slots__ = ("version", "index", "timestamp", "data", "_previous_hash", "ballots",
+                 "_author", "signatures", "required_signatures", "_hash", "extra", "header_hash")
+
+    # Key order of the block's JSON form
+    FIELDS = ("version", "index", "timestamp", "data", "previous_hash", "ballots",
+              "author", "signatures", "required_signatures", "hash")
+
+    def __init__(self):
+        self.version = self.index = self.timestamp = self.data = _MISSING
+        self._previous_hash = self.ballots = self._author = _MISSING
+        self.signatures = _MISSING
+        self.required_signatures = self._hash = _MISSING
+        self.extra = None
+        # Hex digest of the canonical header, filled in by blockchain.header_digest()
+        self.header_hash = None
+
+    @classmethod
+    def from_dict(cls, d):
+        if isinstance(d, Block):
+            return d
+        b = cls()
+        extra = None
+        for key, value in d.items():
+            if key == "version":
+                b.version = sys.intern(value) if isinstance(value, str) else value
+            elif key == "index":
+                b.index = value
+            elif key == "timestamp":
+                b.timestamp = value
+            elif key == "data":
+                b.data = _intern_dict(value)
+            elif key == "previous_hash":
+                b._previous_hash = _digest(value)
+            elif key == "ballots":
+                b.ballots = [_intern_dict(x) for x in value] if isinstance(value, list) else value
+            elif key == "author":
+                b._author = intern_validator(value)
+            elif key == "signatures":
+                b.signatures = [Signature.from_dict(s) for s in value or ()]
+            elif key == "required_signatures":
+                b.required_signatures = value
+            elif key == "hash":
+                b._hash = _digest(value)
+            else:
+                extra = extra or {}
+                extra[key] = value
+        b.extra = extra
+        return b
+
+    def _field(self, key):
+        if key == "previous_hash":
+            return _hex(self._previous_hash)
+        if key == "hash":
+            return _hex(self._hash)
+        if key == "author":
+            return _MISSING if self._author is _MISSING else validator_id(self._author)
+        if key in ("version", "index", "timestamp", "data", "ballots", "signatures", "required_signatures"):
+            return getattr(self, key)
+        return self.extra.get(key, _MISSING) if self.extra else _MISSING
+
+    @property
+    def digest(self):
+        """Raw header digest (bytes), or the stored string if it is not canonical hex."""
+        return self._hash
+
+    @property
+    def previous_digest(self):
+        return self._previous_hash
+
+    def get(self, key, default=None):
+        value = self._field(key)
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key):
+        value = self._field(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._field(key) is not _MISSING
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def has_signature(self, validator):
+        idx = _VALIDATOR_INDEX.get(validator)
+        if idx is None or self.signatures is _MISSING:
+            return False
+        return any(s.validator_index == idx for s in self.signatures)
+
+    def add_signature(self, sig):
+        """Add a Signature unless this validator already signed. Returns True if added."""
+        if self.signatures is _MISSING:
+            self.signatures = []
+        if any(s.validator_index == sig.validator_index for s in self.signatures):
+            return False
+        self.signatures.append(sig)
+        return True
+
+    def to_dict(self):
+        out = {}
+        for key in self.FIELDS:
+            value = self._field(key)
+            if value is _MISSING:
+                continue
+            out[key] = [s.to_dict() for s in value] if key == "signatures" else value
+        if self.extra:
+            out.update(self.extra)
+        return out
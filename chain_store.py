@@ -0,0 +1,455 @@
+import json, os, time, threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from blocks import Block, Signature
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process log lock, run a single worker process
+    fcntl = None
+
+
+class BlockLogStore:
+    """Append-only block log.
+
+    Every block and every late validator signature is written as one JSON line,
+    so persisting a vote or a signature costs a single small append no matter
+    how long the chain is. fsync is batched: the log is fsynced once every
+    ``fsync_every`` records or ``fsync_interval_ms`` milliseconds, whichever
+    comes first; a timer syncs records still pending when no further write
+    arrives within the interval. ``compact`` rewrites the log as a snapshot
+    with signatures folded back into their blocks.
+
+    Record types:
+        {"t": "b", "block": {...}}                      a whole block
+        {"t": "s", "i": 3, "v": "eci", "sig": "..."}    a signature added to block 3
+
+    Several worker processes may share one log: writers take ``exclusive()``
+    (an flock on ``<log>.lock``) and first pick up other writers' records with
+    ``read_new()`` so every append lands on the real chain tip.
+
+    Next to the log live small sidecar files: ``<log>.idx`` holds the byte offset
+    of every block record (8 bytes each) so blocks can be read on demand, and JSON
+    metadata such as the startup snapshot and the validation checkpoint.
+    """
+
+    def __init__(self, path, fsync_every=None, fsync_interval_ms=None):
+        self.path = path
+        if fsync_every is None:
+            fsync_every = _env_int("CHAIN_FSYNC_EVERY", 32)
+        if fsync_interval_ms is None:
+            fsync_interval_ms = _env_int("CHAIN_FSYNC_INTERVAL_MS", 200)
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = max(0, fsync_interval_ms) / 1000.0
+        self._fh = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        # Guards the write handle against the sync timer; see _schedule_sync
+        self._sync_lock = threading.Lock()
+        self._sync_timer = None
+        # (inode, size, mtime_ns) of the log as this process last left it
+        self._own_fp = None
+        # Byte offset up to which this process has read or written the log
+        self._offset = 0
+        self._lock_fh = None
+        # Shared read handle for random block reads
+        self._rfh = None
+        self._read_lock = threading.Lock()
+        # Number of leading entries of the .idx file known to match the current log
+        self._idx_count = 0
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # A forked worker shares our open file descriptions: an flock on a shared lock
+        # handle would not exclude the parent, and seeks on a shared read handle race.
+        # Drop them (without flushing or closing) so the child opens its own.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._fh = self._lock_fh = self._rfh = None
+            self._read_lock = threading.Lock()
+            self._sync_lock = threading.Lock()
+            self._sync_timer = None
+            self._pending = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def fingerprint(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+    def end_offset(self):
+        """Byte offset just past the last record this process read or wrote."""
+        return self._offset
+
+    def changed_externally(self):
+        """True if the log on disk is no longer what this process last read or wrote."""
+        return self._own_fp is not None and self.fingerprint() != self._own_fp
+
+    def needs_reload(self):
+        """True if the log was replaced (compacted), truncated or rewritten in place, so
+        read_new() cannot follow it."""
+        fp = self.fingerprint()
+        if fp is None or self._own_fp is None or fp[0] != self._own_fp[0] or fp[1] < self._offset:
+            return True
+        # Appends always grow the file, so a new mtime with nothing past our offset means
+        # bytes we already read were overwritten (same-size edit)
+        return fp[1] == self._offset and fp != self._own_fp
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the inter-process write lock for the log. Not re-entrant."""
+        if fcntl is None:
+            yield
+            return
+        self._check_fork()
+        if self._lock_fh is None:
+            self._lock_fh = open(self.path + ".lock", "a")
+        fcntl.flock(self._lock_fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fh, fcntl.LOCK_UN)
+
+    # ----------------- Sidecar metadata -----------------
+    def meta_path(self, name):
+        return f"{self.path}.{name}"
+
+    def read_meta(self, name):
+        try:
+            with open(self.meta_path(name), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_meta(self, name, obj):
+        """Atomically replace a small JSON sidecar file next to the log."""
+        path = self.meta_path(name)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(obj, f)
+        os.replace(tmp, path)
+
+    def read_index(self, count):
+        """The first ``count`` block offsets from the .idx file, or None if it is shorter."""
+        offsets = array("Q")
+        try:
+            with open(self.meta_path("idx"), "rb") as f:
+                offsets.fromfile(f, count)
+        except (OSError, EOFError):
+            return None
+        self._idx_count = count
+        return offsets
+
+    def write_index(self, offsets):
+        """Bring the .idx file in line with ``offsets``, appending only entries not yet written."""
+        path = self.meta_path("idx")
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(self._idx_count * offsets.itemsize)
+            f.truncate()
+            offsets[self._idx_count:].tofile(f)
+        self._idx_count = len(offsets)
+
+    # ----------------- Reading -----------------
+    def scan(self, start=0):
+        """Yield (offset, record) for each complete record from byte ``start`` onwards.
+
+        Stops at a torn final line. A complete line that does not decode raises ValueError.
+        Afterwards ``self._offset`` points just past the last record yielded.
+        """
+        self._offset = start
+        if self.exists():
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                pos = start
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # append still in progress, or a crash mid-write
+                    rec = json.loads(line)
+                    yield pos, rec
+                    pos += len(line)
+                    self._offset = pos
+        self._own_fp = self.fingerprint()
+
+    def truncate_tail(self):
+        """Drop anything after the last complete record read by scan(), e.g. a torn final append."""
+        if self.exists() and os.path.getsize(self.path) > self._offset:
+            print(f"⚠ Truncating torn tail of {self.path} at byte {self._offset}")
+            with open(self.path, "r+b") as f:
+                f.truncate(self._offset)
+            self._own_fp = self.fingerprint()
+
+    def read_new(self):
+        """(offset, record) pairs appended by other writers since this process last read or wrote the log.
+
+        Returns None if the bytes after our offset do not decode, meaning the log was
+        rewritten in place and must be reloaded.
+        """
+        try:
+            return list(self.scan(self._offset))
+        except ValueError:
+            return None
+
+    def iter_blocks(self, start=0):
+        """Yield every block record's block from byte ``start`` onwards, through a handle of
+        its own so it can run alongside other reads. Stops at a torn or undecodable line."""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return
+        with f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    return
+                if rec.get("t") == "b":
+                    yield rec.get("block") or {}
+
+    def read_block_at(self, offset):
+        self._check_fork()
+        with self._read_lock:
+            if self._rfh is None:
+                self._rfh = open(self.path, "rb")
+            self._rfh.seek(offset)
+            line = self._rfh.readline()
+        return json.loads(line)["block"]
+
+    def close_reader(self):
+        """Drop the random-read handle, e.g. after the log file was replaced."""
+        with self._read_lock:
+            if self._rfh is not None:
+                self._rfh.close()
+                self._rfh = None
+
+    # ----------------- Writing -----------------
+    def _handle(self):
+        self._check_fork()
+        if self._fh is None:
+            self._fh = open(self.path, "ab")
+        return self._fh
+
+    def _write(self, records):
+        """Append records; returns the byte offset of the first one. Callers hold exclusive()
+        and have caught up with read_new(), so our offset is the end of the log."""
+        fh = self._handle()
+        start = self._offset
+        fh.write(b"".join(_encode(r) for r in records))
+        fh.flush()
+        self._offset = fh.tell()
+        self._pending += len(records)
+        self.sync()
+        self._schedule_sync()
+        self._own_fp = self.fingerprint()
+        return start
+
+    def append_block(self, block):
+        """Append a block record and return its byte offset."""
+        return self._write([{"t": "b", "block": block}])
+
+    def append_signature(self, index, validator_id, sig):
+        self._write([{"t": "s", "i": index, "v": validator_id, "sig": sig}])
+
+    def append_signatures(self, items):
+        """Append many (index, validator_id, sig) tuples in one write."""
+        records = [{"t": "s", "i": i, "v": v, "sig": s} for i, v, s in items]
+        if records:
+            self._write(records)
+
+    def sync(self, force=False):
+        """fsync the log if the batch size or interval has been reached (or when forced)."""
+        with self._sync_lock:
+            if self._fh is None or not self._pending:
+                return
+            now = time.monotonic()
+            if force or self._pending >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                os.fsync(self._fh.fileno())
+                self._pending = 0
+                self._last_sync = now
+
+    def _schedule_sync(self):
+        # Without another write, nothing else would sync the records still pending
+        with self._sync_lock:
+            if not self._pending or self._sync_timer is not None:
+                return
+            self._sync_timer = threading.Timer(self.fsync_interval, self._timed_sync)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _timed_sync(self):
+        with self._sync_lock:
+            self._sync_timer = None
+        try:
+            self.sync(force=True)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Block log fsync failed: {e}")
+
+    def compact(self, blocks):
+        """Atomically replace the log with one record per block; returns the new block offsets.
+
+        ``blocks`` may be any iterable, so a lazily loaded chain is streamed through
+        rather than held in memory.
+        """
+        tmp = self.path + ".tmp"
+        offsets = array("Q")
+        with open(tmp, "wb") as f:
+            for block in blocks:
+                offsets.append(f.tell())
+                f.write(_encode({"t": "b", "block": block}))
+            f.flush()
+            os.fsync(f.fileno())
+        self.close()
+        self.close_reader()
+        os.replace(tmp, self.path)
+        _fsync_dir(self.path)
+        self._offset = os.path.getsize(self.path)
+        self._own_fp = self.fingerprint()
+        self._idx_count = 0
+        return offsets
+
+    def close(self):
+        if self._fh is not None:
+            self.sync(force=True)
+            with self._sync_lock:
+                if self._sync_timer is not None:
+                    self._sync_timer.cancel()
+                    self._sync_timer = None
+                self._fh.close()
+                self._fh = None
+
+
+class LazyChain:
+    """List-like view of the blocks in a BlockLogStore, parsed on access.
+
+    Only the byte offset of every block is held in memory; blocks are read from the
+    log when indexed and kept as compact ``blocks.Block`` objects in a bounded LRU cache. Signatures that were
+    appended after their block was written ("s" records) live in ``overlay`` and are
+    merged into the block each time it is loaded.
+    """
+
+    def __init__(self, store, offsets=None, overlay=None, cache_size=None):
+        self.store = store
+        self.offsets = offsets if offsets is not None else array("Q")
+        self.overlay = overlay if overlay is not None else {}
+        self._overlay_count = sum(len(v) for v in self.overlay.values())
+        if cache_size is None:
+            cache_size = _env_int("CHAIN_BLOCK_CACHE", 10000)
+        self.cache_size = max(1, cache_size)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def read_only(cls, store):
+        """A chain over the log as it is on disk, for tools that must not change it: one pass
+        collects block offsets and late signatures, and nothing is written, truncated or
+        created. Stops at a torn or undecodable record."""
+        chain = cls(store)
+        try:
+            for offset, rec in store.scan(0):
+                kind = rec.get("t")
+                if kind == "b":
+                    chain.offsets.append(offset)
+                elif kind == "s" and isinstance(rec.get("i"), int) and 0 <= rec["i"] < len(chain.offsets):
+                    chain.add_signature(rec["i"], {"validator": rec.get("v"), "sig": rec.get("sig")})
+        except ValueError:
+            pass
+        return chain
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self.offsets)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("block index out of range")
+        with self._lock:
+            block = self._cache.get(i)
+            if block is not None:
+                self._cache.move_to_end(i)
+                return block
+        block = Block.from_dict(self.store.read_block_at(self.offsets[i]))
+        for sig in self.overlay.get(i, ()):
+            _merge_signature(block, sig)
+        self._remember(i, block)
+        return block
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self[i]
+
+    def _remember(self, i, block):
+        with self._lock:
+            self._cache[i] = block
+            self._cache.move_to_end(i)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def append(self, block, offset):
+        """Add the block written at ``offset``; returns it as a blocks.Block."""
+        block = Block.from_dict(block)
+        self.offsets.append(offset)
+        self._remember(len(self.offsets) - 1, block)
+        return block
+
+    def add_signature(self, index, sig):
+        """Record a signature appended to the log after block ``index`` was written."""
+        self.overlay.setdefault(index, []).append(sig)
+        self._overlay_count += 1
+        with self._lock:
+            block = self._cache.get(index)
+        if block is not None:
+            _merge_signature(block, sig)
+
+    def overlay_size(self):
+        return self._overlay_count
+
+
+def _merge_signature(block, sig):
+    block.add_signature(Signature.from_dict(sig))
+
+
+def _to_json(obj):
+    if isinstance(obj, Block):
+        return obj.to_dict()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def _encode(record):
+    return (json.dumps(record, separators=(",", ":"), default=_to_json) + "\n").encode()
+
+
+def _fsync_dir(path):
+    # Make the rename durable; not supported on Windows, where it is a no-op
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, str(default)))
+    except Exception:
+        return default
@@ -0,0 +1,156 @@
+import hashlib, hmac, os, secrets, string, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Password hashing and identifier helpers shared by the web app and the bulk importer.
+# Kept free of Flask/blockchain imports so worker processes can import it cheaply.
+#
+# Passwords are stored as "<kdf>$<params>$<hex digest>", with the salt in its own column.
+# PASSWORD_KDF picks the KDF for new hashes: scrypt (default, memory-hard) or pbkdf2_sha256.
+# Their cost comes from PASSWORD_SCRYPT_N/_R/_P and PASSWORD_PBKDF2_ITERATIONS. Hashes made
+# with other settings, and rows from the original single-round salted SHA-256 scheme, still
+# verify; needs_rehash() tells the login code to store a fresh hash.
+
+metrics.histogram("password_kdf_seconds", "Time to hash or verify one password, by operation")
+metrics.counter("password_kdf_rejected_total", "Password hashes refused because the KDF pool was saturated")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, str(default)))
+    except Exception:
+        return default
+
+
+def _scrypt(password, salt, params):
+    n, r, p = int(params["n"]), int(params["r"]), int(params["p"])
+    return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                          maxmem=256 * r * (n + p + 2), dklen=32).hex()
+
+
+def _pbkdf2_sha256(password, salt, params):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), int(params["i"])).hex()
+
+
+# name -> (derive(password, salt, params) -> hex digest, current parameters from the environment)
+KDFS = {
+    "scrypt": (_scrypt, lambda: {"n": _env_int("PASSWORD_SCRYPT_N", 2 ** 14),
+                                 "r": _env_int("PASSWORD_SCRYPT_R", 8),
+                                 "p": _env_int("PASSWORD_SCRYPT_P", 1)}),
+    "pbkdf2_sha256": (_pbkdf2_sha256, lambda: {"i": _env_int("PASSWORD_PBKDF2_ITERATIONS", 600000)}),
+}
+
+
+def register_kdf(name, derive, params):
+    """Add a KDF: derive(password, salt, params) returns a hex digest, params() the settings for new hashes."""
+    KDFS[name] = (derive, params)
+
+
+def _configured():
+    name = os.environ.get("PASSWORD_KDF", "scrypt")
+    if name not in KDFS:
+        name = "scrypt"
+    return name, KDFS[name][1]()
+
+
+def _encode_params(params):
+    return ",".join(f"{k}={v}" for k, v in params.items())
+
+
+def _decode_params(text):
+    return dict(kv.split("=", 1) for kv in text.split(",") if "=" in kv)
+
+
+def hash_password(password, kdf=None, params=None):
+    """Hash a password with a fresh salt; returns (encoded hash, salt)."""
+    name, current = _configured()
+    if kdf is not None:
+        name, current = kdf, params or KDFS[kdf][1]()
+    salt = secrets.token_hex(16)
+    with metrics.timer("password_kdf_seconds", (("op", "hash"),)):
+        digest = KDFS[name][0](password, salt, current)
+    return f"{name}${_encode_params(current)}${digest}", salt
+
+
+def verify_password(password, hashed_password, salt):
+    """Verify password against hash"""
+    if not hashed_password or salt is None:
+        return False
+    name, sep, rest = hashed_password.partition("$")
+    with metrics.timer("password_kdf_seconds", (("op", "verify"),)):
+        if not sep:
+            # Original scheme: one round of SHA-256 over password + salt
+            expected = hashlib.sha256((password + salt).encode()).hexdigest()
+        else:
+            params, _, digest = rest.partition("$")
+            kdf = KDFS.get(name)
+            if kdf is None:
+                return False
+            try:
+                expected = kdf[0](password, salt, _decode_params(params))
+            except (KeyError, ValueError):
+                return False
+            hashed_password = digest
+    return hmac.compare_digest(expected, hashed_password)
+
+
+def needs_rehash(hashed_password):
+    """True if a stored hash was not made with the configured KDF and cost."""
+    name, current = _configured()
+    return hashed_password.split("$", 2)[:2] != [name, _encode_params(current)]
+
+
+# ----------------- KDF worker pool -----------------
+class CredentialsBusy(Exception):
+    """Raised when too many password hashes are already waiting; ask the user to retry."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+
+
+def _reset_pool():
+    global _pool, _slots
+    _pool = _slots = None
+
+
+if hasattr(os, "register_at_fork"):
+    # The pool's threads do not survive a fork; a forked worker starts its own
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def run_in_pool(fn, *args):
+    """Run a KDF call (hash_password, verify_password) on the shared pool and return its result.
+
+    The pool has KDF_WORKERS threads (default: CPU count); hashlib releases the GIL while it
+    derives, so they run in parallel. A login surge therefore queues for a core instead of
+    oversubscribing CPU and scrypt memory. Once KDF_MAX_PENDING calls (default 8 per worker)
+    are running or queued, further calls raise CredentialsBusy straight away, which keeps
+    the wait of the admitted ones bounded.
+    """
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = max(1, _env_int("KDF_WORKERS", os.cpu_count() or 1))
+                _slots = threading.BoundedSemaphore(max(workers, _env_int("KDF_MAX_PENDING", workers * 8)))
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf")
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        metrics.inc("password_kdf_rejected_total")
+        raise CredentialsBusy("Too many logins in progress")
+    try:
+        return _pool.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def generate_anonymous_token():
+    """Generate a secure anonymous token"""
+    return "ANON_" + ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(12))
+
+def generate_coin_id():
+    """Generate a unique coin id"""
+    return "COIN_" + secrets.token_hex(8).upper()
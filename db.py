@@ -0,0 +1,146 @@
+"""Shared SQLite access layer.
+
+Each thread (and each worker process) keeps one long-lived connection, so the
+sqlite3 prepared-statement cache is reused across requests instead of being
+thrown away with a per-request connection. Connections run in WAL mode with
+synchronous=FULL (every commit is fsynced) and a busy timeout, and writes go
+through explicit transactions that are retried with backoff when the database
+is busy.
+"""
+import os, sqlite3, threading, time, random
+from contextlib import contextmanager
+
+import metrics
+
+DB_FILE = os.environ.get("DB_FILE", "database.db")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, str(default)))
+    except Exception:
+        return default
+
+
+BUSY_TIMEOUT_MS = _env_int("DB_BUSY_TIMEOUT_MS", 5000)
+BUSY_RETRIES = _env_int("DB_BUSY_RETRIES", 5)
+STATEMENT_CACHE_SIZE = _env_int("DB_STATEMENT_CACHE", 256)
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # FULL: a committed vote must survive power loss like the block it is sealed into.
+    # With NORMAL, WAL commits are only fsynced at checkpoints, so a crash could forget a
+    # spent coin whose ballot the ledger writer had already fsynced onto the chain.
+    "PRAGMA synchronous=FULL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+)
+
+metrics.histogram("db_query_seconds", "Time spent in single SQLite statements")
+metrics.histogram("db_transaction_seconds", "Time spent in run_in_transaction, by transaction function")
+metrics.counter("db_busy_retries_total", "Statements or transactions retried because SQLite was busy")
+_QUERY_ONE = (("op", "query_one"),)
+_QUERY_ALL = (("op", "query_all"),)
+_EXECUTE = (("op", "execute"),)
+
+_local = threading.local()
+_generation = 0
+
+
+def configure(path):
+    """Point the pool at another database file; existing thread connections are replaced lazily."""
+    global DB_FILE, _generation
+    DB_FILE = path
+    _generation += 1
+
+
+def _connect():
+    # isolation_level=None: statements autocommit unless run inside transaction()
+    conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT_MS / 1000.0,
+                           isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection():
+    """This thread's pooled connection, reopened after a fork or a configure() call."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and _local.generation == _generation:
+        return conn
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = _connect()
+    _local.pid = os.getpid()
+    _local.generation = _generation
+    return _local.conn
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def _is_busy(exc):
+    msg = str(exc).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def _backoff(attempt):
+    time.sleep(min(0.5, 0.01 * (2 ** attempt)) * (0.5 + random.random()))
+
+
+def query_one(sql, params=()):
+    with metrics.timer("db_query_seconds", _QUERY_ONE):
+        return get_connection().execute(sql, params).fetchone()
+
+
+def query_all(sql, params=()):
+    with metrics.timer("db_query_seconds", _QUERY_ALL):
+        return get_connection().execute(sql, params).fetchall()
+
+
+def execute(sql, params=()):
+    """Run a single autocommit statement, retrying while the database is busy."""
+    for attempt in range(BUSY_RETRIES + 1):
+        try:
+            with metrics.timer("db_query_seconds", _EXECUTE):
+                return get_connection().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == BUSY_RETRIES:
+                raise
+            metrics.inc("db_busy_retries_total")
+            _backoff(attempt)
+
+
+@contextmanager
+def transaction(immediate=True):
+    """BEGIN (IMMEDIATE by default, taking the write lock up front) ... COMMIT, or ROLLBACK on error."""
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def run_in_transaction(fn, immediate=True):
+    """Call fn(conn) inside a transaction and return its result, retrying the whole
+    transaction with backoff if SQLite reports the database as busy/locked."""
+    labels = (("fn", getattr(fn, "__name__", "unknown")),)
+    for attempt in range(BUSY_RETRIES + 1):
+        try:
+            with metrics.timer("db_transaction_seconds", labels), transaction(immediate=immediate) as conn:
+                return fn(conn)
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == BUSY_RETRIES:
+                raise
+            metrics.inc("db_busy_retries_total")
+            _backoff(attempt)
@@ -0,0 +1,213 @@
+"""Export the ledger and results as a certification bundle, and verify one.
+
+    python export_chain.py export results.tar [--chunk-blocks 10000] [--shard N]
+    python export_chain.py verify results.tar
+
+The bundle is a tar archive written in one pass over the chain:
+
+    blocks/000000.jsonl.gz   blocks 0 .. chunk-1, one JSON block per line (gzip)
+    blocks/000001.jsonl.gz   ...
+    manifest.json            height, tip hash, per-chunk SHA-256 of the compressed
+                             member, the tally recounted from the exported blocks,
+                             and validator certifications of all of the above
+
+Only one chunk is held in memory while exporting. verify streams the archive
+the same way: every block is checked with blockchain.check_block, ballots are
+recounted with blockchain.count_votes, and the chunk hashes, tally and
+certifications are compared with the manifest at the end. Validator secrets
+come from the same POA_*_SECRET variables the app uses.
+"""
+import argparse, gzip, hashlib, hmac, io, json, sys, tarfile, time
+
+from blockchain import check_block, count_votes, load_validators, sign
+
+FORMAT = "chain-export/1"
+MANIFEST = "manifest.json"
+
+
+def manifest_digest(manifest):
+    """SHA-256 over the manifest without its certifications; this is what validators sign."""
+    body = {k: v for k, v in manifest.items() if k != "certifications"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def export_chain(blockchain, out_path, chunk_blocks=10000):
+    """Write the chain up to its current height to ``out_path``; returns the manifest.
+    ``blockchain`` is a Blockchain or a read-only blockchain.ChainReader."""
+    chunk_blocks = max(1, chunk_blocks)
+    height = blockchain.get_height()
+    tally, buckets, chunks = {}, {}, []
+    last_hash = None
+    with tarfile.open(out_path, "w") as tar:
+        for n, lo in enumerate(range(0, height, chunk_blocks)):
+            hi = min(lo + chunk_blocks, height)
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode="wb", mtime=0) as gz:
+                for block in blockchain.get_blocks(lo, hi):
+                    gz.write((json.dumps(block, separators=(",", ":")) + "\n").encode())
+                    count_votes(block, tally, buckets)
+                    last_hash = block.get("hash")
+            data = buf.getvalue()
+            name = f"blocks/{n:06d}.jsonl.gz"
+            _add_member(tar, name, data)
+            chunks.append({"name": name, "first": lo, "count": hi - lo,
+                           "sha256": hashlib.sha256(data).hexdigest(), "last_hash": last_hash})
+        manifest = {
+            "format": FORMAT,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "height": height,
+            "tip_hash": last_hash,
+            "threshold": blockchain.threshold,
+            "chunks": chunks,
+            "tally": tally,
+            "tally_buckets": buckets,
+            "votes": sum(tally.values()),
+        }
+        digest = manifest_digest(manifest)
+        signers = blockchain.validators[:blockchain.threshold]
+        manifest["certifications"] = [{"validator": v["id"], "sig": sign(v["secret"], digest)} for v in signers]
+        _add_member(tar, MANIFEST, json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+class _HashingReader:
+    """File wrapper hashing every byte read through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+
+    def read(self, n=-1):
+        data = self.f.read(n)
+        self.sha.update(data)
+        return data
+
+    def drain(self):
+        while self.read(1 << 16):
+            pass
+        return self.sha.hexdigest()
+
+
+def verify_bundle(path, validators=None):
+    """Check a bundle in one streaming pass. Returns {"valid", "reason", "first_invalid",
+    "height", "chunks", "tally", "certified_by"}."""
+    secrets = {v["id"]: v["secret"] for v in (validators or load_validators())}
+    report = {"valid": False, "reason": None, "first_invalid": None, "height": 0, "chunks": 0,
+              "tally": {}, "certified_by": []}
+    tally, buckets, seen = {}, {}, []
+    prev_hash = None
+    index = 0
+    manifest = None
+
+    def fail(reason, at=None):
+        report["reason"] = reason
+        report["first_invalid"] = at
+        return report
+
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            if manifest is not None:
+                return fail(f"unexpected member {member.name} after the manifest")
+            f = tar.extractfile(member)
+            if f is None:
+                continue
+            if member.name == MANIFEST:
+                try:
+                    manifest = json.load(f)
+                except ValueError:
+                    return fail("manifest is not valid JSON")
+                continue
+            if not member.name.startswith("blocks/"):
+                return fail(f"unexpected member {member.name}")
+            reader = _HashingReader(f)
+            first = index
+            with gzip.GzipFile(fileobj=reader, mode="rb") as gz:
+                for line in gz:
+                    block = json.loads(line)
+                    if block.get("index") != index:
+                        return fail("block out of order", index)
+                    if index > 0:
+                        reason = check_block(prev_hash, block, secrets)
+                        if reason:
+                            return fail(reason, index)
+                    count_votes(block, tally, buckets)
+                    prev_hash = block.get("hash")
+                    index += 1
+            seen.append({"name": member.name, "first": first, "count": index - first,
+                         "sha256": reader.drain(), "last_hash": prev_hash})
+    report.update(height=index, chunks=len(seen), tally=tally)
+    if manifest is None:
+        return fail("bundle has no manifest")
+    if manifest.get("format") != FORMAT:
+        return fail(f"unknown bundle format {manifest.get('format')!r}")
+    if manifest.get("height") != index or manifest.get("tip_hash") != prev_hash:
+        return fail("manifest height or tip hash does not match the blocks")
+    for ours, theirs in zip(seen, manifest.get("chunks") or []):
+        if ours != theirs:
+            return fail(f"chunk {ours['name']} does not match its manifest entry", ours["first"])
+    if len(seen) != len(manifest.get("chunks") or []):
+        return fail("manifest lists a different number of chunks")
+    if manifest.get("tally") != tally or manifest.get("tally_buckets") != buckets:
+        return fail("manifest tally does not match the recount")
+    digest = manifest_digest(manifest)
+    certified = []
+    for c in manifest.get("certifications") or []:
+        secret = secrets.get(c.get("validator"))
+        if secret is not None and c.get("validator") not in certified and \
+                hmac.compare_digest(sign(secret, digest), str(c.get("sig") or "")):
+            certified.append(c.get("validator"))
+    report["certified_by"] = certified
+    if len(certified) < (manifest.get("threshold") or 1):
+        return fail("not enough valid certifications")
+    report["valid"] = True
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or verify a chain certification bundle.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ex = sub.add_parser("export", help="write the chain and tally to a bundle")
+    ex.add_argument("path")
+    ex.add_argument("--chunk-blocks", type=int, default=10000, help="blocks per compressed chunk")
+    ex.add_argument("--shard", type=int, default=0, help="ledger shard to export when CHAIN_SHARDS > 1")
+    ve = sub.add_parser("verify", help="check a bundle")
+    ve.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from blockchain import ChainReader
+        from shards import shard_count, shard_log_path
+        t0 = time.time()
+        if not 0 <= args.shard < shard_count():
+            print(f"❌ No shard {args.shard}: CHAIN_SHARDS is {shard_count()}")
+            return 1
+        # Read-only: the live log is exported as it is, never migrated, compacted or created
+        try:
+            chain = ChainReader(shard_log_path(args.shard))
+        except FileNotFoundError as e:
+            print(f"❌ Cannot export shard {args.shard}: {e}")
+            return 1
+        manifest = export_chain(chain, args.path, args.chunk_blocks)
+        print(f"✅ Exported {manifest['height']} blocks in {len(manifest['chunks'])} chunk(s) to {args.path} "
+              f"({manifest['votes']} votes, {time.time() - t0:.1f}s)")
+        return 0
+    report = verify_bundle(args.path)
+    if report["valid"]:
+        print(f"✅ Bundle valid: {report['height']} blocks, {report['chunks']} chunk(s), "
+              f"certified by {', '.join(report['certified_by'])}")
+        print(json.dumps(report["tally"], indent=2))
+        return 0
+    where = f" at block #{report['first_invalid']}" if report["first_invalid"] is not None else ""
+    print(f"❌ Bundle invalid{where}: {report['reason']}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
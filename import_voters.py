@@ -0,0 +1,125 @@
+"""Bulk-load an electoral roll into the voters and coins tables.
+
+    python import_voters.py voters.csv [--batch-size 5000] [--workers 4] [--db database.db]
+
+The CSV needs a header with at least voter_id, name and password columns, and may
+have a constituency column (which picks the voter's ledger shard). Rows are
+streamed, hashed in a process pool, and inserted with executemany in one transaction
+per batch. The number of rows done is committed in that same transaction, so an
+interrupted import resumes from the last finished batch when run again. Voter IDs
+that are already registered are skipped.
+"""
+import argparse, csv, itertools, os, sys, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import db, schema
+from credentials import hash_password, generate_anonymous_token, generate_coin_id
+
+REQUIRED_COLUMNS = ("voter_id", "name", "password")
+
+
+def _hash_chunk(rows):
+    """Worker: hash credentials and mint identifiers for one batch of (voter_id, name, password, constituency)."""
+    out = []
+    for voter_id, name, password, constituency in rows:
+        if not voter_id or not password:
+            continue
+        hashed_pwd, salt = hash_password(password)
+        out.append((voter_id, name, hashed_pwd, salt, generate_anonymous_token(), constituency, generate_coin_id()))
+    return out
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _load_progress(source, size, restart):
+    row = db.query_one("SELECT source_size, rows_done FROM import_progress WHERE source=?", (source,))
+    if not row or restart:
+        return 0
+    if row[0] != size:
+        raise SystemExit(f"{source} changed since the last import (size {row[0]} -> {size}); "
+                         "re-run with --restart to import it from the beginning")
+    return row[1] or 0
+
+
+def _insert_batch(source, size, rows_done, records):
+    """Insert one hashed batch and advance the resume point atomically. Returns new voters inserted."""
+    def insert(conn):
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO voters(voter_id,name,password,salt,anonymous_token,constituency,aadhaar_verified) VALUES (?,?,?,?,?,?,1)",
+            [r[:6] for r in records])
+        inserted = conn.total_changes - before
+        # Mint one coin per voter that does not have one yet
+        conn.executemany(
+            "INSERT INTO coins(coin_id, voter_id, spent) SELECT ?, ?, 0 "
+            "WHERE NOT EXISTS (SELECT 1 FROM coins WHERE voter_id=?)",
+            [(r[6], r[0], r[0]) for r in records])
+        conn.execute("INSERT OR REPLACE INTO import_progress(source, source_size, rows_done, updated_at) VALUES (?,?,?,?)",
+                     (source, size, rows_done, time.strftime("%Y-%m-%d %H:%M:%S")))
+        return inserted
+    return db.run_in_transaction(insert)
+
+
+def import_csv(path, batch_size=5000, workers=None, restart=False):
+    """Stream a voter CSV into the database. Returns (rows_done, voters_inserted)."""
+    source = os.path.abspath(path)
+    size = os.path.getsize(path)
+    workers = workers or os.cpu_count() or 1
+    rows_done = _load_progress(source, size, restart)
+    if rows_done:
+        print(f"↪ Resuming {path} after row {rows_done}")
+    inserted = 0
+    started = time.perf_counter()
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise SystemExit(f"{path} is missing column(s): {', '.join(missing)}")
+        rows = ((r["voter_id"].strip(), (r["name"] or "").strip(), r["password"],
+                 (r.get("constituency") or "").strip() or None) for r in reader)
+        rows = itertools.islice(rows, rows_done, None)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Keep a few batches hashing ahead of the writer, but commit strictly in file order
+            in_flight = deque()
+
+            def drain_one():
+                nonlocal rows_done, inserted
+                count, future = in_flight.popleft()
+                rows_done += count
+                inserted += _insert_batch(source, size, rows_done, future.result())
+                rate = rows_done / max(time.perf_counter() - started, 1e-9)
+                print(f"📥 {rows_done} rows processed, {inserted} new voters ({rate:,.0f} rows/s)", flush=True)
+
+            for chunk in _chunks(rows, batch_size):
+                in_flight.append((len(chunk), pool.submit(_hash_chunk, chunk)))
+                if len(in_flight) >= workers * 2:
+                    drain_one()
+            while in_flight:
+                drain_one()
+    print(f"✅ Import of {path} complete: {rows_done} rows, {inserted} new voters")
+    return rows_done, inserted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load voters from a CSV file.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: CPU count)")
+    parser.add_argument("--db", help="database file (default: DB_FILE or database.db)")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved resume point")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    schema.migrate_schema()
+    import_csv(args.csv_path, batch_size=max(1, args.batch_size), workers=args.workers, restart=args.restart)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
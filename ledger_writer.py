@@ -0,0 +1,218 @@
+"""Background ledger writer.
+
+vote() commits the votes row (the durable record of the ballot) and hands the
+ballot to this writer's bounded queue, then returns. A single thread drains the
+queue, seals ballots into blocks and marks each votes row with its block index.
+
+To stay safe with several worker processes and across crashes, sealing claims
+the rows first: with the block log's write lock held, a row is only appended if
+a conditional UPDATE finds it unclaimed and unsealed, and its block index is
+recorded once the block is fsynced, before the lock is released. At startup recover() finishes any seal a
+crashed process left half done and replays committed votes that never reached
+the chain. With a sharded ledger (shards.py) there is one writer per shard, and
+each only recovers and sweeps the votes rows of its own shard.
+"""
+import os, queue, threading, time
+
+import db, metrics
+
+metrics.counter("ledger_ballots_sealed_total", "Ballots appended to the chain by the ledger writer")
+metrics.counter("ledger_ballots_replayed_total", "Committed votes replayed onto the chain by recovery")
+metrics.counter("ledger_queue_overflows_total", "Ballots left for a database sweep because the queue was full")
+metrics.histogram("ledger_queue_wait_seconds", "Time a ballot waited in the ledger queue")
+
+_STOP = object()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, str(default)))
+    except Exception:
+        return default
+
+
+def _ballot(token, candidate, coin_id):
+    return {"anonymous_token": token, "vote": candidate, "coin_id": coin_id}
+
+
+class LedgerWriter:
+    def __init__(self, blockchain, queue_size=None, shard=0):
+        self.blockchain = blockchain
+        # votes.shard this writer seals (NULL counts as shard 0)
+        self.shard = shard
+        self.queue_size = max(1, queue_size or _env_int("LEDGER_QUEUE_SIZE", 10000))
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._overflow = False
+        if hasattr(os, "register_at_fork"):
+            # A forked worker (e.g. gunicorn --preload) inherits the queue but not the thread
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._overflow = False
+
+    # ----------------- Producer side -----------------
+    def start(self):
+        """Run crash recovery, then start the writer thread. Safe to call more than once."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            try:
+                self.recover()
+            except Exception as e:
+                print(f"⚠ Ledger recovery failed: {e}")
+                # Retried by the sweep after the writer's first batch
+                self._overflow = True
+            self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, vote_id, ballot):
+        """Queue a committed vote for sealing without blocking (callers hold vote_handoff_lock).
+        If the queue is full, the vote is left to the writer's next database sweep, which
+        picks up every unsealed votes row."""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait((vote_id, ballot, time.monotonic()))
+        except queue.Full:
+            self._overflow = True
+            metrics.inc("ledger_queue_overflows_total")
+            print("⚠ Ledger queue full; vote left for the next sweep")
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until every ballot queued so far has been sealed (or failed)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self):
+        """Seal what is queued and stop the thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    # ----------------- Writer thread -----------------
+    def _run(self):
+        batch_size = max(self.blockchain.batch_size, 1)
+        wait = self.blockchain.batch_ms / 1000.0 if batch_size > 1 else 0
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            # Gather a block's worth (or whatever is already queued when not batching)
+            deadline = time.monotonic() + wait
+            while len(batch) < max(batch_size, 256):
+                try:
+                    nxt = self._queue.get(timeout=max(0, deadline - time.monotonic())) if wait else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+            now = time.monotonic()
+            for _, _, queued_at in batch:
+                metrics.observe("ledger_queue_wait_seconds", now - queued_at)
+            try:
+                self._seal([(vote_id, ballot) for vote_id, ballot, _ in batch])
+            except Exception as e:
+                # The batch's votes rows may be left claimed, with or without their ballots on
+                # the log; the sweep below settles those claims first, then retries the rest
+                print(f"⚠ Ledger writer failed to seal {len(batch)} ballot(s): {e}")
+                self._overflow = True
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if self._overflow and self._queue.empty():
+                self._overflow = False
+                self._safe_sweep()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _seal(self, items):
+        placed = self.blockchain.append_ballots(items, claim=self._claim, record=self._record)
+        metrics.inc("ledger_ballots_sealed_total", len(placed))
+        return placed
+
+    @staticmethod
+    def _claim(items, height):
+        # Runs under the chain write lock: only rows nobody has claimed or sealed are appended
+        def claim(conn):
+            claimed = []
+            for vote_id, ballot in items:
+                c = conn.execute("UPDATE votes SET claimed_height=? WHERE id=? AND block_index IS NULL AND claimed_height IS NULL",
+                                 (height, vote_id))
+                if c.rowcount == 1:
+                    claimed.append((vote_id, ballot))
+            return claimed
+        return db.run_in_transaction(claim)
+
+    @staticmethod
+    def _record(placed):
+        def record(conn):
+            conn.executemany("UPDATE votes SET block_index=? WHERE id=?", [(index, vote_id) for vote_id, index in placed])
+        db.run_in_transaction(record)
+
+    # ----------------- Recovery -----------------
+    def recover(self):
+        """Repair after a crash: settle half-finished seals, then replay unsealed votes."""
+        self._settle_claims()
+        replayed = self.sweep()
+        if replayed:
+            metrics.inc("ledger_ballots_replayed_total", replayed)
+            print(f"✅ Ledger recovery replayed {replayed} committed vote(s) onto the chain")
+
+    def _settle_claims(self):
+        # Rows claimed but never marked: the writer died, or its append or record failed,
+        # between claiming and recording. Their ballots may or may not have reached the log.
+        if not db.query_one("SELECT 1 FROM votes WHERE block_index IS NULL AND claimed_height IS NOT NULL "
+                            "AND coalesce(shard, 0)=? LIMIT 1", (self.shard,)):
+            return
+        with self.blockchain.write_lock():
+            rows = db.query_all("SELECT id, coin_id, claimed_height FROM votes "
+                                "WHERE block_index IS NULL AND claimed_height IS NOT NULL AND coalesce(shard, 0)=?",
+                                (self.shard,))
+            if not rows:
+                return
+            found = self.blockchain.find_ballots([r[1] for r in rows], start=min(r[2] for r in rows))
+
+            def settle(conn):
+                for vote_id, coin_id, _ in rows:
+                    if coin_id in found:
+                        conn.execute("UPDATE votes SET block_index=? WHERE id=?", (found[coin_id], vote_id))
+                    else:
+                        conn.execute("UPDATE votes SET claimed_height=NULL WHERE id=?", (vote_id,))
+            db.run_in_transaction(settle)
+        print(f"✅ Ledger recovery settled {len(rows)} interrupted seal(s), {len(found)} already on the chain")
+
+    def sweep(self, chunk=1000):
+        """Seal every committed vote not yet claimed or on the chain, oldest first.
+        Returns how many were appended by this call."""
+        done, last_id = 0, 0
+        while True:
+            rows = db.query_all("SELECT id, anonymous_token, candidate, coin_id FROM votes "
+                                "WHERE block_index IS NULL AND claimed_height IS NULL AND id > ? AND coalesce(shard, 0)=? "
+                                "ORDER BY id LIMIT ?", (last_id, self.shard, chunk))
+            if not rows:
+                return done
+            last_id = rows[-1][0]
+            done += len(self._seal([(r[0], _ballot(r[1], r[2], r[3])) for r in rows]))
+
+    def _safe_sweep(self):
+        try:
+            self._settle_claims()
+            self.sweep()
+        except Exception as e:
+            print(f"⚠ Ledger sweep failed: {e}")
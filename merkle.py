@@ -0,0 +1,57 @@
+import hashlib, json
+
+# Domain separation so a leaf can never be confused with an interior node
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(ballot):
+    """Hash of one ballot dict, canonically encoded."""
+    encoded = json.dumps(ballot, sort_keys=True).encode()
+    return hashlib.sha256(LEAF_PREFIX + encoded).hexdigest()
+
+
+def _node_hash(left, right):
+    return hashlib.sha256(NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def _next_level(level):
+    # An odd node out is promoted unchanged rather than paired with itself
+    nxt = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        nxt.append(level[-1])
+    return nxt
+
+
+def merkle_root(leaves):
+    """Root of a list of leaf hashes (hex). The empty tree hashes to sha256(b"")."""
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+    level = list(leaves)
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+
+def merkle_proof(leaves, index):
+    """Inclusion proof for leaves[index]: a list of {"side": "L"|"R", "hash": ...} steps."""
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({"side": "L" if sibling < index else "R", "hash": level[sibling]})
+        level = _next_level(level)
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, proof, root):
+    """Check that a leaf hash is committed to by root."""
+    acc = leaf
+    for step in proof:
+        if step.get("side") == "L":
+            acc = _node_hash(step["hash"], acc)
+        else:
+            acc = _node_hash(acc, step["hash"])
+    return acc == root
@@ -0,0 +1,197 @@
+"""In-process counters and latency histograms, rendered in the Prometheus text format.
+
+Metrics are declared once with counter()/histogram() and updated by name:
+
+    metrics.inc("votes_cast_total")
+    with metrics.timer("db_query_seconds", (("op", "query_one"),)):
+        ...
+
+Labels are a tuple of (name, value) pairs. Each worker process keeps its own
+numbers; scrape every worker. Set METRICS_ENABLED=0 to turn recording off, in
+which case timed() leaves functions undecorated and timer() does nothing.
+"""
+import bisect, cProfile, os, threading, time
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_metrics = {}
+_gauges = {}
+
+
+def _reset_lock():
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    # A child forked while another thread held the lock (e.g. a full audit's worker pool,
+    # forked from a threaded server) would deadlock on its first timed call
+    os.register_at_fork(after_in_child=_reset_lock)
+
+
+class _Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+
+class _Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.values = {}
+
+
+def counter(name, help=""):
+    return _metrics.setdefault(name, _Counter(name, help))
+
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS):
+    return _metrics.setdefault(name, _Histogram(name, help, buckets))
+
+
+def gauge(name, help, fn):
+    """A value read at scrape time from fn(); errors are skipped."""
+    _gauges[name] = (help, fn)
+
+
+def inc(name, amount=1, labels=()):
+    if not ENABLED:
+        return
+    m = _metrics[name]
+    with _lock:
+        m.values[labels] = m.values.get(labels, 0) + amount
+
+
+def observe(name, seconds, labels=()):
+    if not ENABLED:
+        return
+    m = _metrics[name]
+    i = bisect.bisect_left(m.buckets, seconds)
+    with _lock:
+        v = m.values.get(labels)
+        if v is None:
+            v = m.values[labels] = [[0] * (len(m.buckets) + 1), 0.0, 0]
+        v[0][i] += 1
+        v[1] += seconds
+        v[2] += 1
+
+
+class timer:
+    """Context manager observing the elapsed time of its block into a histogram."""
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started, self.labels)
+        return False
+
+
+def timed(name, labels=()):
+    """Decorator form of timer(); a no-op when metrics are disabled."""
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started, labels)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        wrapper.__wrapped__ = fn
+        return wrapper
+    return wrap
+
+
+def _fmt_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _lock:
+        snapshot = [(m, {k: (list(v[0]), v[1], v[2]) if m.kind == "histogram" else v
+                         for k, v in m.values.items()}) for m in _metrics.values()]
+    for m, values in snapshot:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        for labels, v in sorted(values.items()):
+            if m.kind == "counter":
+                lines.append(f"{m.name}{_fmt_labels(labels)} {_fmt_value(v)}")
+                continue
+            counts, total, count = v
+            cumulative = 0
+            for bound, n in zip(m.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{m.name}_bucket{_fmt_labels(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{m.name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+            lines.append(f"{m.name}_count{_fmt_labels(labels)} {count}")
+    for name, (help, fn) in _gauges.items():
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def profile_requests(app, directory):
+    """Profile every request of a Flask app with cProfile and dump the stats to
+    ``directory`` (one .prof file per request, readable with pstats or snakeviz).
+    Only installed when asked for, so requests pay nothing otherwise."""
+    from flask import g, request
+    os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def _start_profile():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # another request on this process is already being profiled
+        g._profiler = profiler
+
+    @app.teardown_request
+    def _dump_profile(exc):
+        profiler = g.pop("_profiler", None)
+        if profiler is None:
+            return
+        profiler.disable()
+        name = f"{time.time_ns()}-{os.getpid()}-{request.method}-{request.endpoint or 'unknown'}.prof"
+        try:
+            profiler.dump_stats(os.path.join(directory, name))
+        except OSError as e:
+            print(f"Profile dump failed: {e}")
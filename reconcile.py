@@ -0,0 +1,290 @@
+"""Reconcile the coins and votes tables with the ballots on the chain.
+
+    python reconcile.py [--repair] [--json report.json] [--samples 20] [--db database.db]
+
+vote() spends a coin and writes its votes row in one transaction and the ledger
+writer seals the ballot afterwards, but the two stores can still drift apart: a
+block log restored from an older backup, a votes row marked sealed whose block
+is gone, or a ballot on the chain for a coin the database never spent. Both
+sides are streamed in coin_id order and merge-joined, so memory does not grow
+with the size of the election:
+
+- the database side is one query over coins (in the order of their unique
+  coin_id index) left-joined to votes through idx_votes_coin_id;
+- the chain side is read sequentially from every shard's block log, cut into
+  sorted runs of RECONCILE_RUN_SIZE ballots (default 500000) spilled to
+  temporary files, and merged.
+
+Votes the ledger writer has not sealed yet are counted as pending, not as drift.
+The block logs are only read (blockchain.ChainReader): a report never migrates,
+compacts, snapshots or creates a log. --repair opens the ledger for writing and
+puts the ballots of spent coins missing from the chain back through the ledger
+writer, which claims each votes row first so nothing is sealed twice.
+"""
+import argparse, heapq, itertools, json, os, sys, tempfile, time
+from contextlib import ExitStack
+
+import db, schema
+from blockchain import block_ballots
+
+ISSUES = (
+    "missing_block",           # coin spent in the database, no ballot on the chain
+    "block_for_unspent_coin",  # ballot on the chain, coin not spent in the database
+    "block_for_unknown_coin",  # ballot on the chain, coin not in the database at all
+    "duplicate_ballot",        # several ballots on the chain spend the same coin
+    "candidate_mismatch",      # the chain's ballot names another candidate than the coin
+    "block_index_mismatch",    # the votes row points at another shard or block than the chain
+)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, str(default)))
+    except Exception:
+        return default
+
+
+RUN_SIZE = _env_int("RECONCILE_RUN_SIZE", 500000)
+
+
+def _chunks(items, size):
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ----------------- Database side -----------------
+def _coin_rows():
+    """(coin_id, spent, spent_to, vote_id, candidate, block_index, shard) for every coin, in coin_id order."""
+    yield from db.get_connection().execute(
+        "SELECT c.coin_id, c.spent, c.spent_to, v.id, v.candidate, v.block_index, coalesce(v.shard, 0) "
+        "FROM coins c LEFT JOIN votes v ON v.coin_id = c.coin_id "
+        "WHERE c.coin_id IS NOT NULL ORDER BY c.coin_id")
+
+
+# ----------------- Chain side -----------------
+def _chain_ballots(chains, heights, report):
+    """(coin_id, shard, block_index, vote) for every ballot with a coin id in blocks
+    [0, height) of each shard, in chain order."""
+    for shard, (chain, height) in enumerate(zip(chains, heights)):
+        if not height:
+            continue
+        for block in chain.store.iter_blocks(0):
+            index = block.get("index", 0)
+            if index >= height:
+                break
+            for ballot in block_ballots(block):
+                coin = ballot.get("coin_id")
+                if coin:
+                    yield coin, shard, index, ballot.get("vote")
+                else:
+                    report["ballots_without_coin"] += 1
+
+
+def _read_run(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _external_sort(records, tmpdir, run_size):
+    """Sort (coin_id, shard, block_index, vote) records by coin_id, then place on the chain,
+    holding at most run_size of them in memory: sorted runs go to tmpdir and are merged back."""
+    key = lambda r: (r[0], r[1], r[2])
+    runs = []
+    for run in _chunks(iter(records), run_size):
+        run.sort(key=key)
+        if not runs and len(run) < run_size:
+            return iter(run)  # everything fit in one run
+        path = os.path.join(tmpdir, f"run{len(runs):05d}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for rec in run:
+                f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+        runs.append(path)
+    return heapq.merge(*(_read_run(p) for p in runs), key=key)
+
+
+# ----------------- Merge-join -----------------
+def _check_coin(coin, rows, ballots, heights, issue, report):
+    """Compare one coin's database rows with its ballots on the chain."""
+    spent = bool(rows and rows[0][1])
+    spent_to = rows[0][2] if rows else None
+    votes = [r for r in rows if r[3] is not None]
+    report["coins"] += 1 if rows else 0
+    report["spent"] += 1 if spent else 0
+    report["ballots"] += len(ballots)
+
+    if not ballots:
+        if not spent:
+            return
+        if any(v[5] is None or v[6] >= len(heights) or v[5] >= heights[v[6]] for v in votes):
+            # Waiting for the ledger writer, or sealed after the chain scan started
+            report["pending"] += 1
+            return
+        issue("missing_block", coin, candidate=spent_to, shard=votes[0][6] if votes else None,
+              recorded_block=votes[0][5] if votes else None)
+        return
+
+    shard, block, vote = ballots[0][1], ballots[0][2], ballots[0][3]
+    clean = True
+    if not rows:
+        issue("block_for_unknown_coin", coin, shard=shard, block_index=block)
+        clean = False
+    elif not spent:
+        issue("block_for_unspent_coin", coin, shard=shard, block_index=block)
+        clean = False
+    if len(ballots) > 1:
+        issue("duplicate_ballot", coin, blocks=[[b[1], b[2]] for b in ballots])
+        clean = False
+    if spent:
+        expected = spent_to if spent_to is not None else (votes[0][4] if votes else None)
+        if expected is not None and vote != expected:
+            issue("candidate_mismatch", coin, shard=shard, block_index=block, chain=vote, database=expected)
+            clean = False
+        recorded = [(v[6], v[5]) for v in votes if v[5] is not None and v[5] >= 0]
+        if recorded and (shard, block) not in recorded:
+            issue("block_index_mismatch", coin, shard=shard, block_index=block,
+                  recorded_shard=recorded[0][0], recorded_block=recorded[0][1])
+            clean = False
+    if clean and spent:
+        report["matched"] += 1
+
+
+def reconcile(ledger, samples=20, run_size=None, tmpdir=None, on_missing=None):
+    """Merge-join the coins/votes tables with the ballots on the chain by coin_id. ``ledger``
+    is a list with one chain per shard (read-only blockchain.ChainReaders or Blockchains),
+    a shards.ShardedLedger (every shard is read) or a single Blockchain.
+
+    Returns a report with counts per issue kind and up to ``samples`` examples of each.
+    ``on_missing(coin_id)`` is called for every spent coin with no ballot on the chain.
+    """
+    chains = ledger if isinstance(ledger, list) else getattr(ledger, "shards", [ledger])
+    heights = [chain.get_height() for chain in chains]
+    report = {"height": sum(heights), "shards": len(chains), "coins": 0, "spent": 0, "ballots": 0,
+              "ballots_without_coin": 0, "matched": 0, "pending": 0, "issues": dict.fromkeys(ISSUES, 0),
+              "samples": {kind: [] for kind in ISSUES}}
+
+    def issue(kind, coin, **detail):
+        report["issues"][kind] += 1
+        if len(report["samples"][kind]) < samples:
+            report["samples"][kind].append(dict(coin_id=coin, **detail))
+        if kind == "missing_block" and on_missing is not None:
+            on_missing(coin)
+
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="reconcile-", dir=tmpdir) as tmp:
+        first = lambda r: r[0]
+        chain = itertools.groupby(_external_sort(_chain_ballots(chains, heights, report), tmp,
+                                                 max(1, run_size or RUN_SIZE)), key=first)
+        coins = itertools.groupby(_coin_rows(), key=first)
+        c, d = next(chain, None), next(coins, None)
+        while c is not None or d is not None:
+            if d is None or (c is not None and c[0] < d[0]):
+                coin, rows, ballots = c[0], [], list(c[1])
+                c = next(chain, None)
+            elif c is None or d[0] < c[0]:
+                coin, rows, ballots = d[0], list(d[1]), []
+                d = next(coins, None)
+            else:
+                coin, rows, ballots = c[0], list(d[1]), list(c[1])
+                c, d = next(chain, None), next(coins, None)
+            _check_coin(coin, rows, ballots, heights, issue, report)
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+
+# ----------------- Repair -----------------
+def repair(ledger, coin_ids, chunk=1000):
+    """Seal the ballots of spent coins that are missing from the chain. Returns how many were appended.
+    ``ledger`` is a writable shards.ShardedLedger or Blockchain.
+
+    Each coin's votes row is marked unsealed again (or rebuilt from the coin and its voter if
+    it is gone), then the ledger writer of its shard sweeps it onto the chain.
+    """
+    from ledger_writer import LedgerWriter
+    chains = getattr(ledger, "shards", [ledger])
+    shard_for = getattr(ledger, "shard_for", lambda constituency: 0)
+    while ledger.index_backlog():
+        time.sleep(0.1)
+    requeued = set()
+    for coins in _chunks(iter(coin_ids), chunk):
+        with ExitStack() as locks:
+            for chain in chains:
+                locks.enter_context(chain.write_lock())
+            # Another process may have sealed some of them since the scan
+            coins = [coin for coin in coins if ledger.locate_ballot(coin_id=coin) is None]
+
+            def requeue(conn):
+                shards = set()
+                for coin in coins:
+                    c = conn.execute("UPDATE votes SET block_index=NULL, claimed_height=NULL "
+                                     "WHERE coin_id=? AND block_index IS NOT NULL", (coin,))
+                    row = conn.execute("SELECT coalesce(shard, 0) FROM votes WHERE coin_id=?", (coin,)).fetchone()
+                    if row is not None:
+                        if c.rowcount:
+                            shards.add(row[0])
+                        continue
+                    voter = conn.execute("SELECT v.anonymous_token, c.spent_to, c.spent_at, v.constituency FROM coins c "
+                                         "LEFT JOIN voters v ON v.voter_id = c.voter_id WHERE c.coin_id=? AND c.spent=1",
+                                         (coin,)).fetchone()
+                    if voter is not None:
+                        shard = shard_for(voter[3])
+                        conn.execute("INSERT INTO votes(anonymous_token, candidate, timestamp, coin_id, shard) "
+                                     "VALUES (?,?,?,?,?)", (voter[0], voter[1], voter[2], coin, shard))
+                        shards.add(shard)
+                return shards
+            requeued |= db.run_in_transaction(requeue)
+    return sum(LedgerWriter(chains[shard], shard=shard).sweep() for shard in sorted(requeued) if shard < len(chains))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile the votes database with the blockchain ledger.")
+    parser.add_argument("--repair", action="store_true", help="re-seal ballots of spent coins missing from the chain")
+    parser.add_argument("--json", help="write the full report to this file")
+    parser.add_argument("--samples", type=int, default=20, help="examples to keep per issue kind")
+    parser.add_argument("--run-size", type=int, default=None, help="ballots per sorted run (default: RECONCILE_RUN_SIZE)")
+    parser.add_argument("--tmpdir", help="directory for sorted runs (default: system temp)")
+    parser.add_argument("--db", help="database file (default: DB_FILE or database.db)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    schema.migrate_schema()
+    from blockchain import ChainReader
+    from shards import shard_count, shard_log_path
+    try:
+        chains = [ChainReader(shard_log_path(i)) for i in range(shard_count())]
+    except FileNotFoundError as e:
+        print(f"❌ {e}; CHAIN_SHARDS ({shard_count()}) must match the ledger being reconciled")
+        return 2
+
+    with tempfile.TemporaryFile("w+", encoding="utf-8", dir=args.tmpdir) as spool:
+        report = reconcile(chains, samples=max(0, args.samples), run_size=args.run_size, tmpdir=args.tmpdir,
+                           on_missing=(lambda coin: spool.write(coin + "\n")) if args.repair else None)
+        print(f"🔍 Reconciled {report['coins']} coins ({report['spent']} spent) with {report['ballots']} ballots "
+              f"in {report['height']} blocks ({report['shards']} shard(s)) in {report['seconds']}s: {report['matched']} matched, "
+              f"{report['pending']} pending")
+        for kind in ISSUES:
+            if report["issues"][kind]:
+                print(f"⚠ {kind}: {report['issues'][kind]}")
+                for sample in report["samples"][kind]:
+                    print(f"    {json.dumps(sample)}")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+        remaining = sum(report["issues"].values())
+        if args.repair and report["issues"]["missing_block"]:
+            spool.seek(0)
+            # Only a repair writes, so only a repair opens the ledger for writing
+            from shards import ShardedLedger
+            appended = repair(ShardedLedger(), (line.strip() for line in spool))
+            print(f"✅ Repair sealed {appended} ballot(s) onto the chain")
+            remaining -= report["issues"]["missing_block"]
+    if not remaining:
+        print("✅ Database and ledger agree")
+    return 1 if remaining else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+"""Chain replication to validator nodes.
+
+The Flask app runs a ReplicationHub when REPLICATION_ADDRESS is set. Each
+validator can then run its own node process, holding its own secret and its
+own copy of the block log:
+
+    VALIDATOR_SECRET=... python replication.py --validator auditor --primary unix:replication.sock
+
+The hub streams new blocks to every connected node. A node checks each block
+(linkage, header hash, Merkle root), appends it to its log, co-signs it and
+streams the signature back; the hub verifies the signature before adding it to
+the chain. A node that reconnects says how far its copy goes and is sent only
+the missing range.
+
+Messages are JSON objects, one per line, over a pluggable transport. Unix
+sockets (``unix:/path``) and TCP (``tcp:host:port``) are built in;
+register_transport() adds others.
+
+    hub  -> node  {"op": "challenge", "nonce": hex}
+    node -> hub   {"op": "hello", "validator": id, "auth": mac, "height": n, "tip": hash}
+    hub  -> node  {"op": "welcome", "height": n, "signed_upto": n}  or  {"op": "reset", "reason": ...}
+    hub  -> node  {"op": "blocks", "start": i, "blocks": [...]}
+    node -> hub   {"op": "fetch", "start": i, "end": j}
+    node -> hub   {"op": "sigs", "sigs": [[index, sig], ...]}
+    hub  -> node  {"op": "ack", "accepted": n, "rejected": [...], "signed_upto": n}
+"""
+import argparse, hashlib, hmac, json, os, secrets, socket, threading, time
+
+import metrics
+from blockchain import check_block_contents, header_digest, sign
+from blocks import Block, Signature
+from chain_store import BlockLogStore, LazyChain
+
+metrics.counter("replication_blocks_sent_total", "Blocks sent to validator nodes")
+metrics.counter("replication_signatures_total", "Co-signatures received from validator nodes, by validator and result")
+
+# Largest message accepted from a peer
+MAX_MESSAGE = 64 * 1024 * 1024
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, str(default)))
+    except Exception:
+        return default
+
+
+def hello_mac(secret, nonce):
+    # Prefixed so a hub cannot get a node to sign a block hash by sending it as the nonce
+    return hmac.new(secret.encode(), ("replication-hello:" + nonce).encode(), hashlib.sha256).hexdigest()
+
+
+# ----------------- Transports -----------------
+class Connection:
+    """A stream socket carrying newline-delimited JSON messages. send() is thread-safe."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._rfile = sock.makefile("rb")
+        self._send_lock = threading.Lock()
+        self.closed = False
+
+    def send(self, msg):
+        data = (json.dumps(msg, separators=(",", ":")) + "\n").encode()
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    def recv(self):
+        """The next message, or None once the peer has closed the connection."""
+        line = self._rfile.readline(MAX_MESSAGE + 1)
+        if not line:
+            return None
+        if not line.endswith(b"\n"):
+            raise ConnectionError("message truncated or larger than MAX_MESSAGE")
+        return json.loads(line)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._rfile.close()
+        self.sock.close()
+
+
+class _Listener:
+    def __init__(self, sock, cleanup=None):
+        self.sock = sock
+        self._cleanup = cleanup
+
+    def accept(self):
+        sock, _ = self.sock.accept()
+        return Connection(sock)
+
+    def close(self):
+        self.sock.close()
+        if self._cleanup:
+            self._cleanup()
+
+
+class TcpTransport:
+    def __init__(self, address):
+        host, _, port = address.rpartition(":")
+        self.addr = (host or "127.0.0.1", int(port))
+
+    def listen(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.addr)
+        sock.listen(16)
+        return _Listener(sock)
+
+    def connect(self, timeout=10):
+        sock = socket.create_connection(self.addr, timeout=timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return Connection(sock)
+
+
+class UnixTransport:
+    def __init__(self, path):
+        self.path = path
+
+    def listen(self):
+        if os.path.exists(self.path):
+            # Left behind by a process that died, unless someone still answers on it
+            try:
+                self.connect(timeout=1).close()
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise OSError(f"{self.path} is already being served")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        sock.listen(16)
+        return _Listener(sock, cleanup=lambda: os.path.exists(self.path) and os.unlink(self.path))
+
+    def connect(self, timeout=10):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(None)
+        return Connection(sock)
+
+
+TRANSPORTS = {"unix": UnixTransport, "tcp": TcpTransport}
+
+
+def register_transport(scheme, factory):
+    """Make ``scheme:...`` addresses usable. ``factory(rest_of_address)`` returns an object
+    with listen() (-> object with accept() -> Connection, and close()) and connect() (-> Connection)."""
+    TRANSPORTS[scheme] = factory
+
+
+def transport_for(address):
+    scheme, sep, rest = address.partition(":")
+    if not sep or scheme not in TRANSPORTS:
+        raise ValueError(f"Unsupported replication address {address!r}; use unix:/path or tcp:host:port")
+    return TRANSPORTS[scheme](rest)
+
+
+# ----------------- Hub (runs next to the chain) -----------------
+class ReplicationHub:
+    def __init__(self, blockchain, address, batch=None, poll_ms=None):
+        self.blockchain = blockchain
+        self.address = address
+        self.transport = transport_for(address)
+        # Blocks per message, and how often to look for blocks other worker processes appended
+        self.batch = max(1, batch or _env_int("REPLICATION_BATCH", 100))
+        self.poll = max(10, poll_ms or _env_int("REPLICATION_POLL_MS", 500)) / 1000.0
+        self._listener = None
+        self._stopped = threading.Event()
+        # Bumped for every block added, so push threads wake up
+        self._changed = threading.Condition()
+        self._version = 0
+        self._nodes = {}
+        self._nodes_lock = threading.Lock()
+
+    def start(self):
+        """Start serving nodes. Returns False if the address is unusable, e.g. because another
+        worker process already serves it (that hub sees every worker's blocks through the log)."""
+        try:
+            self._listener = self.transport.listen()
+        except OSError as e:
+            print(f"⚠ Replication hub not started on {self.address}: {e}")
+            return False
+        self.blockchain.add_block_listener(self._on_block)
+        for target, name in ((self._accept_loop, "replication-accept"), (self._watch, "replication-watch")):
+            threading.Thread(target=target, name=name, daemon=True).start()
+        print(f"✅ Replication hub listening on {self.address}")
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        with self._nodes_lock:
+            conns = list(self._nodes)
+        for conn in conns:
+            conn.close()
+        self._on_block(None)
+
+    def nodes(self):
+        """Validator ids of the connected nodes."""
+        with self._nodes_lock:
+            return sorted(self._nodes.values())
+
+    def _on_block(self, index):
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    def _watch(self):
+        # Blocks appended by other worker processes only show up here after a refresh
+        while not self._stopped.wait(self.poll):
+            try:
+                self.blockchain.refresh()
+            except Exception as e:
+                print(f"⚠ Replication hub could not refresh the chain: {e}")
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, AttributeError):
+                if self._stopped.is_set():
+                    return
+                time.sleep(0.1)
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="replication-node", daemon=True).start()
+
+    def _serve(self, conn):
+        validator = None
+        try:
+            validator, start = self._handshake(conn)
+            if validator is None:
+                return
+            with self._nodes_lock:
+                self._nodes[conn] = validator
+            threading.Thread(target=self._push, args=(conn, start), name="replication-push", daemon=True).start()
+            while True:
+                msg = conn.recv()
+                if msg is None:
+                    break
+                op = msg.get("op")
+                if op == "fetch":
+                    self._send_range(conn, msg.get("start"), msg.get("end"))
+                elif op == "sigs":
+                    self._receive_signatures(conn, validator, msg.get("sigs"))
+                else:
+                    conn.send({"op": "error", "reason": f"unknown op {op!r}"})
+        except (OSError, ValueError) as e:
+            if not conn.closed:
+                print(f"⚠ Validator node {validator or '?'} dropped: {e}")
+        finally:
+            with self._nodes_lock:
+                self._nodes.pop(conn, None)
+            conn.close()
+            self._on_block(None)  # let its push thread exit
+
+    def _handshake(self, conn):
+        """Authenticate the node and find where its copy of the chain ends.
+        Returns (validator_id, height) or (None, 0) if the node was turned away."""
+        nonce = secrets.token_hex(32)
+        conn.send({"op": "challenge", "nonce": nonce})
+        hello = conn.recv()
+        if not hello or hello.get("op") != "hello":
+            return None, 0
+        validator = hello.get("validator")
+        v = next((x for x in self.blockchain.validators if x["id"] == validator), None)
+        if v is None or not hmac.compare_digest(hello_mac(v["secret"], nonce), str(hello.get("auth") or "")):
+            conn.send({"op": "error", "reason": "authentication failed"})
+            return None, 0
+        height = self.blockchain.get_height()
+        node_height = hello.get("height")
+        if not isinstance(node_height, int) or node_height < 0:
+            node_height = 0
+        if node_height and (node_height > height or
+                            self.blockchain.chain[node_height - 1].get("hash") != hello.get("tip")):
+            conn.send({"op": "reset", "reason": f"block {node_height - 1} does not match the primary chain"})
+            return None, 0
+        conn.send({"op": "welcome", "height": height, "signed_upto": self.blockchain.signed_upto(validator)})
+        print(f"✅ Validator node {validator} connected at height {node_height} (chain height {height})")
+        return validator, node_height
+
+    def _push(self, conn, sent):
+        """Stream the blocks from ``sent`` onwards to the node, then new blocks as they come."""
+        try:
+            while not conn.closed and not self._stopped.is_set():
+                with self._changed:
+                    version = self._version
+                height = self.blockchain.get_height()
+                if sent < height:
+                    sent = self._send_range(conn, sent, height)
+                    continue
+                with self._changed:
+                    if self._version == version:
+                        self._changed.wait(self.poll)
+        except OSError:
+            conn.close()
+
+    def _send_range(self, conn, start, end):
+        """Send up to ``batch`` blocks from [start, end); returns the index after the last one sent."""
+        if not isinstance(start, int) or not isinstance(end, int):
+            conn.send({"op": "error", "reason": "fetch needs integer start and end"})
+            return start
+        blocks = self.blockchain.get_blocks(start, min(end, start + self.batch))
+        conn.send({"op": "blocks", "start": start, "blocks": blocks})
+        metrics.inc("replication_blocks_sent_total", len(blocks))
+        return start + len(blocks)
+
+    def _receive_signatures(self, conn, validator, sigs):
+        pairs = [(p[0], p[1]) for p in sigs or () if isinstance(p, list) and len(p) == 2]
+        result = self.blockchain.add_signatures(validator, pairs)
+        metrics.inc("replication_signatures_total", result["accepted"], (("validator", validator), ("result", "accepted")))
+        if result["rejected"]:
+            metrics.inc("replication_signatures_total", len(result["rejected"]), (("validator", validator), ("result", "rejected")))
+            print(f"⚠ Rejected {len(result['rejected'])} signature(s) from validator node {validator}")
+        conn.send(dict(result, op="ack"))
+
+
+# ----------------- Validator node (its own process) -----------------
+class ValidatorNode:
+    """One validator's copy of the chain, kept in step with a hub and co-signed with its own secret."""
+
+    def __init__(self, validator_id, secret, address, log_path):
+        self.validator_id = validator_id
+        self.secret = secret
+        self.address = address
+        self.transport = transport_for(address)
+        self.log_path = log_path
+        self.store = BlockLogStore(log_path)
+        self.chain = LazyChain(self.store)
+        self._stop = threading.Event()
+        self._conn = None
+        self._load()
+
+    def _load(self):
+        try:
+            for offset, rec in self.store.scan():
+                if rec.get("t") == "b":
+                    self.chain.append(rec.get("block") or {}, offset)
+                elif rec.get("t") == "s" and isinstance(rec.get("i"), int) and 0 <= rec["i"] < len(self.chain):
+                    self.chain.add_signature(rec["i"], {"validator": rec.get("v"), "sig": rec.get("sig")})
+        except ValueError:
+            pass  # undecodable record: treat as a torn tail
+        self.store.truncate_tail()
+        print(f"✅ Node {self.validator_id} loaded {len(self.chain)} blocks from {self.log_path}")
+
+    def height(self):
+        return len(self.chain)
+
+    def run(self):
+        """Stay connected to the hub, reconnecting with backoff, until stop() is called."""
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                self._conn = conn = self.transport.connect()
+            except OSError as e:
+                print(f"⚠ Cannot reach {self.address}: {e}; retrying in {backoff}s")
+            else:
+                try:
+                    self.session(conn)
+                    backoff = 1
+                except (OSError, ValueError) as e:
+                    if not self._stop.is_set():
+                        print(f"⚠ Replication connection lost: {e}")
+                finally:
+                    conn.close()
+            if self._stop.wait(backoff):
+                break
+            backoff = min(backoff * 2, 30)
+
+    def stop(self):
+        self._stop.set()
+        if self._conn is not None:
+            self._conn.close()
+
+    def session(self, conn):
+        challenge = conn.recv()
+        if not challenge or challenge.get("op") != "challenge":
+            raise ValueError("hub did not send a challenge")
+        height = len(self.chain)
+        conn.send({"op": "hello", "validator": self.validator_id, "auth": hello_mac(self.secret, str(challenge.get("nonce"))),
+                   "height": height, "tip": self.chain[-1].get("hash") if height else None})
+        reply = conn.recv()
+        if reply is None:
+            raise ConnectionError("hub closed the connection")
+        if reply.get("op") == "reset":
+            self._discard(reply.get("reason"))
+            return
+        if reply.get("op") != "welcome":
+            raise ValueError(reply.get("reason") or f"unexpected reply {reply.get('op')!r}")
+        # Signatures sent just before a disconnect may never have reached the hub
+        upto = reply.get("signed_upto")
+        self._resend_signatures(conn, upto if isinstance(upto, int) else 0)
+        while not self._stop.is_set():
+            msg = conn.recv()
+            if msg is None:
+                return
+            op = msg.get("op")
+            if op == "blocks":
+                sigs = self._apply_blocks(conn, msg.get("start"), msg.get("blocks") or [])
+                if sigs:
+                    conn.send({"op": "sigs", "sigs": sigs})
+            elif op == "ack":
+                if msg.get("rejected"):
+                    print(f"⚠ Hub rejected signatures for blocks {msg['rejected'][:10]}")
+            elif op == "error":
+                print(f"⚠ Hub reported: {msg.get('reason')}")
+
+    def _apply_blocks(self, conn, start, blocks):
+        """Check, store and co-sign blocks received from the hub. Returns [[index, sig]] to send back."""
+        if not isinstance(start, int):
+            raise ValueError("blocks message without a start index")
+        height = len(self.chain)
+        if start > height:
+            # A gap: ask for the missing range, which will be followed by these blocks again
+            conn.send({"op": "fetch", "start": height, "end": start + len(blocks)})
+            return []
+        sigs = []
+        for i, d in enumerate(blocks):
+            index = start + i
+            if index < len(self.chain):
+                continue
+            block = Block.from_dict(d)
+            prev = self.chain[-1].get("hash") if index else None
+            reason = "index mismatch" if block.get("index") != index else check_block_contents(prev, block)
+            if reason:
+                raise ValueError(f"block {index} from the hub failed verification: {reason}")
+            if not block.has_signature(self.validator_id):
+                sig = sign(self.secret, header_digest(block))
+                block.add_signature(Signature(self.validator_id, sig))
+                sigs.append([index, sig])
+            self.chain.append(block, self.store.append_block(block))
+        return sigs
+
+    def _resend_signatures(self, conn, start, batch=500):
+        for lo in range(max(0, start), len(self.chain), batch):
+            sigs = [[i, sign(self.secret, header_digest(self.chain[i]))]
+                    for i in range(lo, min(lo + batch, len(self.chain)))]
+            conn.send({"op": "sigs", "sigs": sigs})
+
+    def _discard(self, reason):
+        # Our copy forked from the primary's; keep it aside for inspection and start over
+        print(f"⚠ Node chain does not match the primary ({reason}); moving it to {self.log_path}.diverged")
+        self.store.close()
+        self.store.close_reader()
+        if self.store.exists():
+            os.replace(self.log_path, self.log_path + ".diverged")
+        self.store = BlockLogStore(self.log_path)
+        self.chain = LazyChain(self.store)
+
+    def close(self):
+        self.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a validator node that replicates and co-signs the chain.")
+    parser.add_argument("--validator", required=True, help="validator id, e.g. eci")
+    parser.add_argument("--primary", default=os.environ.get("REPLICATION_ADDRESS", "unix:replication.sock"),
+                        help="hub address, unix:/path or tcp:host:port (default $REPLICATION_ADDRESS)")
+    parser.add_argument("--log", help="this node's block log (default node_<validator>.log)")
+    args = parser.parse_args()
+    secret = os.environ.get("VALIDATOR_SECRET")
+    if not secret:
+        parser.error("set VALIDATOR_SECRET to this validator's signing secret")
+    node = ValidatorNode(args.validator, secret, args.primary, args.log or f"node_{args.validator}.log")
+    try:
+        node.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        node.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import db
+from credentials import hash_password, generate_anonymous_token
+
+# Versioned schema migrations. Each step runs once, in order, in its own transaction, and
+# PRAGMA user_version records the last applied step so startup skips work already done.
+def _table_columns(c, table):
+    return {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+
+def _add_missing_columns(c, table, columns):
+    have = _table_columns(c, table)
+    for name, decl in columns:
+        if name not in have:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+def _migration_base_schema(c):
+    # Create voters table with new schema
+    c.execute("""CREATE TABLE IF NOT EXISTS voters(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    voter_id TEXT UNIQUE,
+                    name TEXT,
+                    password TEXT,
+                    salt TEXT,
+                    anonymous_token TEXT UNIQUE,
+                    has_voted INTEGER DEFAULT 0,
+                    mobile TEXT,
+                    aadhaar_hash TEXT,
+                    aadhaar_last4 TEXT,
+                    aadhaar_verified INTEGER DEFAULT 0)""")
+    # Older databases predate some columns. SQLite cannot ADD COLUMN ... UNIQUE, so
+    # uniqueness of anonymous_token is enforced by an index below instead.
+    _add_missing_columns(c, "voters", [
+        ("salt", "TEXT"),
+        ("anonymous_token", "TEXT"),
+        ("has_voted", "INTEGER DEFAULT 0"),
+        ("mobile", "TEXT"),
+        ("aadhaar_hash", "TEXT"),
+        ("aadhaar_last4", "TEXT"),
+        ("aadhaar_verified", "INTEGER DEFAULT 0"),
+    ])
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_voters_anonymous_token ON voters(anonymous_token)")
+
+    # Create admin table
+    c.execute("""CREATE TABLE IF NOT EXISTS admin(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE,
+                    password TEXT)""")
+
+    # Create votes table with new schema
+    c.execute("""CREATE TABLE IF NOT EXISTS votes(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    anonymous_token TEXT,
+                    candidate TEXT,
+                    timestamp TEXT)""")
+    _add_missing_columns(c, "votes", [("anonymous_token", "TEXT"), ("timestamp", "TEXT")])
+
+    # Create coins table (one coin per voter, spent when voting)
+    c.execute("""CREATE TABLE IF NOT EXISTS coins(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    coin_id TEXT UNIQUE,
+                    voter_id TEXT,
+                    spent INTEGER DEFAULT 0,
+                    spent_to TEXT,
+                    spent_at TEXT)""")
+
+def _migration_indexes(c):
+    # Covers "SELECT coin_id FROM coins WHERE voter_id=? AND spent=0" and the backfill probe
+    c.execute("CREATE INDEX IF NOT EXISTS idx_coins_voter_spent ON coins(voter_id, spent, coin_id)")
+    # Spent/unspent scans ordered by coin_id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_coins_spent ON coins(spent, coin_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_votes_anonymous_token ON votes(anonymous_token)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_votes_candidate ON votes(candidate)")
+
+def _migration_backfill(c):
+    # Mint a coin for any voter lacking one; same format as generate_coin_id()
+    c.execute("""
+        INSERT OR IGNORE INTO coins(coin_id, voter_id, spent)
+        SELECT 'COIN_' || upper(hex(randomblob(8))), v.voter_id, 0 FROM voters v
+        WHERE NOT EXISTS (SELECT 1 FROM coins c2 WHERE c2.voter_id = v.voter_id)
+    """)
+    # Generate anonymous tokens for existing voters
+    missing = [row[0] for row in c.execute("SELECT voter_id FROM voters WHERE anonymous_token IS NULL")]
+    for vid in missing:
+        c.execute("UPDATE voters SET anonymous_token=? WHERE voter_id=?", (generate_anonymous_token(), vid))
+    # Backfill existing rows to not block old users: set aadhaar_verified=1 if NULL
+    c.execute("UPDATE voters SET aadhaar_verified=1 WHERE aadhaar_verified IS NULL")
+
+def _migration_import_progress(c):
+    # Resume points for bulk voter imports (import_voters.py), keyed by source file
+    c.execute("""CREATE TABLE IF NOT EXISTS import_progress(
+                    source TEXT PRIMARY KEY,
+                    source_size INTEGER,
+                    rows_done INTEGER DEFAULT 0,
+                    updated_at TEXT)""")
+
+def _migration_hash_legacy_passwords(c):
+    # Voters created before salted hashing still hold a plaintext password
+    rows = c.execute("SELECT voter_id, password, anonymous_token FROM voters WHERE salt IS NULL").fetchall()
+    if rows:
+        print(f"🔄 Migrating {len(rows)} existing voter(s) to the salted password scheme...")
+    for voter_id, old_password, token in rows:
+        hashed_pwd, salt = hash_password(old_password or "")
+        c.execute("UPDATE voters SET password=?, salt=?, anonymous_token=? WHERE voter_id=?",
+                  (hashed_pwd, salt, token or generate_anonymous_token(), voter_id))
+
+def _migration_ledger_tracking(c):
+    # The votes row is the durable record of a ballot until the ledger writer seals it:
+    # claimed_height is set (to the chain height) while a writer appends it, block_index once on the chain
+    _add_missing_columns(c, "votes", [
+        ("coin_id", "TEXT"),
+        ("block_index", "INTEGER"),
+        ("claimed_height", "INTEGER"),
+    ])
+    # Votes cast before this migration were added to the chain synchronously
+    c.execute("UPDATE votes SET block_index=-1 WHERE block_index IS NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_votes_unsealed ON votes(id) WHERE block_index IS NULL")
+
+def _migration_hash_admin_passwords(c):
+    # Admin passwords were stored and compared in plaintext
+    _add_missing_columns(c, "admin", [("salt", "TEXT")])
+    for admin_id, password in c.execute("SELECT id, password FROM admin WHERE salt IS NULL").fetchall():
+        hashed_pwd, salt = hash_password(password or "")
+        c.execute("UPDATE admin SET password=?, salt=? WHERE id=?", (hashed_pwd, salt, admin_id))
+
+def _migration_votes_coin_index(c):
+    # Lets reconcile.py join spent coins to their votes rows in coin_id order
+    c.execute("CREATE INDEX IF NOT EXISTS idx_votes_coin_id ON votes(coin_id)")
+
+def _migration_shards(c):
+    # Ledger shards (shards.py): a voter's constituency picks the chain their ballot is sealed
+    # on, and the votes row remembers that shard for the ledger writer and reconcile.py
+    _add_missing_columns(c, "voters", [("constituency", "TEXT")])
+    _add_missing_columns(c, "votes", [("shard", "INTEGER")])
+
+MIGRATIONS = [
+    (1, "base schema", _migration_base_schema),
+    (2, "coin/vote indexes", _migration_indexes),
+    (3, "backfill coins and anonymous tokens", _migration_backfill),
+    (4, "bulk import progress", _migration_import_progress),
+    (5, "hash legacy plaintext passwords", _migration_hash_legacy_passwords),
+    (6, "ledger tracking for votes", _migration_ledger_tracking),
+    (7, "hash admin passwords", _migration_hash_admin_passwords),
+    (8, "votes coin_id index", _migration_votes_coin_index),
+    (9, "ledger shards", _migration_shards),
+]
+
+def migrate_schema(target=None):
+    """Apply any schema migrations newer than the database's recorded version (up to target)."""
+    current = db.query_one("PRAGMA user_version")[0]
+    for version, description, step in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+
+        def apply(conn):
+            # Another worker may have applied this step while we waited for the write lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                return False
+            step(conn.cursor())
+            conn.execute(f"PRAGMA user_version={version}")
+            return True
+        if db.run_in_transaction(apply):
+            print(f"✅ Applied schema migration {version}: {description}")
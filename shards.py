@@ -0,0 +1,298 @@
+"""Sharded ledger: the chain split by constituency, tied together by a root chain.
+
+CHAIN_SHARDS (default 1) sets the number of shards. Shard 0 is the original
+CHAIN_LOG_FILE; shard i lives next to it as <name>.shard<i>.log. Each shard is a
+complete Blockchain with its own block log, file lock, snapshot, ballot index and
+ledger writer, so ballots for different shards are sealed independently: their
+fsyncs overlap within a process, and worker processes appending to different
+shards never wait on each other's lock.
+
+A voter's shard follows from the constituency on their voters row (shard_for);
+voters without one vote on shard 0. Every ROOT_BLOCK_MS (default 5000) a block is
+added to the root chain (<name>.root.log) committing to each shard's height and
+tip hash, signed by the validators like any other block. Tallies, vote counts,
+validity checks and receipts are answered across all shards.
+
+With CHAIN_SHARDS=1 there is no root chain and ShardedLedger simply forwards to
+the single Blockchain. Changing CHAIN_SHARDS moves constituencies between shards,
+so it should not change while an election is running.
+"""
+import hashlib, os, threading
+
+from blockchain import Blockchain
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, str(default)))
+    except Exception:
+        return default
+
+
+def _base_log_path():
+    return os.environ.get("CHAIN_LOG_FILE", "blockchain.log")
+
+
+def shard_count():
+    """Number of shards configured by CHAIN_SHARDS (at least 1)."""
+    return max(1, _env_int("CHAIN_SHARDS", 1))
+
+
+def shard_log_path(shard, base=None):
+    """Block log of a shard: the configured log for shard 0, <name>.shard<NN><ext> otherwise."""
+    base = base or _base_log_path()
+    if not shard:
+        return base
+    name, ext = os.path.splitext(base)
+    return f"{name}.shard{shard:02d}{ext or '.log'}"
+
+
+def root_log_path(base=None):
+    name, ext = os.path.splitext(base or _base_log_path())
+    return f"{name}.root{ext or '.log'}"
+
+
+class ShardedLedger:
+    def __init__(self, count=None, log_path=None):
+        self.count = max(1, count or shard_count())
+        base = log_path or _base_log_path()
+        # Only shard 0 imports a legacy blockchain.json
+        self.shards = [Blockchain(log_path=shard_log_path(i, base), legacy_path=None if i == 0 else "")
+                       for i in range(self.count)]
+        self.root = Blockchain(log_path=root_log_path(base), legacy_path="") if self.count > 1 else None
+        self.root_interval = max(1, _env_int("ROOT_BLOCK_MS", 5000)) / 1000.0
+        self._root_thread = None
+        self._stop = threading.Event()
+        # Where the last validity check failed: {"index", "reason", "shard"}, or None
+        self.last_failure = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._root_thread = None
+        self._stop = threading.Event()
+
+    def shard(self, index):
+        """The Blockchain of shard ``index``; raises IndexError for an unknown shard."""
+        if not 0 <= index < self.count:
+            raise IndexError(f"no shard {index}")
+        return self.shards[index]
+
+    def shard_for(self, constituency):
+        """Shard number for a constituency (shard 0 for none), stable across processes and restarts."""
+        if self.count == 1 or not constituency:
+            return 0
+        key = constituency.strip().lower().encode()
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") % self.count
+
+    # ----------------- Root chain -----------------
+    def start(self):
+        """Start committing shard tips to the root chain every ROOT_BLOCK_MS. Safe to call more than once."""
+        if self.root is None or self._root_thread is not None:
+            return
+        self._root_thread = threading.Thread(target=self._run_root, name="shard-root", daemon=True)
+        self._root_thread.start()
+
+    def stop(self):
+        """Stop the root thread and commit the final shard tips."""
+        if self._root_thread is not None:
+            self._stop.set()
+            self._root_thread.join()
+            self._root_thread = None
+        if self.root is not None:
+            self.commit_root()
+
+    def _run_root(self):
+        while not self._stop.wait(self.root_interval):
+            try:
+                self.commit_root()
+            except Exception as e:
+                print(f"⚠ Root block failed: {e}")
+
+    def shard_tips(self):
+        """[{"shard", "height", "tip"}] for every shard, caught up with other processes."""
+        tips = []
+        for i, shard in enumerate(self.shards):
+            shard.refresh()
+            height = shard.get_height()
+            tips.append({"shard": i, "height": height, "tip": shard.chain[height - 1].get("hash") if height else None})
+        return tips
+
+    def commit_root(self):
+        """Add a root block for the current shard tips if any shard moved since the last one.
+        Returns the root block's index, or None."""
+        if self.root is None:
+            return None
+
+        def make(last):
+            tips = self.shard_tips()
+            if (last.get("data") or {}).get("shards") == tips:
+                return None
+            return {"type": "shard_tips", "shards": tips}
+        index = self.root.add_block_if(make)
+        if index is not None:
+            print(f"✅ Root block {index} commits to {self.count} shard tips")
+        return index
+
+    def _check_root(self, index):
+        """Why root block ``index`` does not match the shards, or None."""
+        for tip in (self.root.chain[index].get("data") or {}).get("shards", []):
+            i, height = tip.get("shard"), tip.get("height")
+            if not isinstance(i, int) or not 0 <= i < self.count or not isinstance(height, int):
+                return "root block names an unknown shard"
+            shard = self.shards[i]
+            if height > shard.get_height() or (height and shard.chain[height - 1].get("hash") != tip.get("tip")):
+                return f"shard {i} no longer has the tip committed at height {height}"
+        return None
+
+    def root_anchor(self, shard, block_index):
+        """The first root block committing to ``block_index`` of ``shard``, as {"root_index",
+        "root_hash"}, or None if no root block covers it yet. Binary search: committed
+        heights only grow along the root chain."""
+        if self.root is None:
+            return None
+
+        def height_at(i):
+            for tip in (self.root.chain[i].get("data") or {}).get("shards", []):
+                if tip.get("shard") == shard:
+                    return tip.get("height") or 0
+            return 0
+        lo, hi = 1, self.root.get_height()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if height_at(mid) > block_index:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo >= self.root.get_height():
+            return None
+        return {"root_index": lo, "root_hash": self.root.chain[lo].get("hash")}
+
+    # ----------------- Aggregated reads -----------------
+    def _chains(self):
+        return self.shards + ([self.root] if self.root is not None else [])
+
+    def refresh(self):
+        for chain in self._chains():
+            chain.refresh()
+
+    def state_tag(self):
+        return "|".join(chain.state_tag() for chain in self._chains())
+
+    def get_height(self):
+        """Blocks across all shards (the root chain not included)."""
+        return sum(shard.get_height() for shard in self.shards)
+
+    def get_tally(self):
+        tally = {}
+        for shard in self.shards:
+            for cand, n in shard.get_tally().items():
+                tally[cand] = tally.get(cand, 0) + n
+        return tally
+
+    def get_tally_buckets(self):
+        buckets = {}
+        for shard in self.shards:
+            for bucket, counts in shard.get_tally_buckets().items():
+                merged = buckets.setdefault(bucket, {})
+                for cand, n in counts.items():
+                    merged[cand] = merged.get(cand, 0) + n
+        return dict(sorted(buckets.items()))
+
+    def get_vote_count(self):
+        return sum(shard.get_vote_count() for shard in self.shards)
+
+    def is_valid(self, full=False):
+        """Every shard and the root chain are valid, and the root chain's latest block (every
+        root block with full=True) matches the shards' history."""
+        self.last_failure = None
+        for i, shard in enumerate(self.shards):
+            if not shard.is_valid(full=full):
+                failure = shard.last_failure or {}
+                self.last_failure = {"index": failure.get("index"), "reason": failure.get("reason"), "shard": i}
+                if self.count > 1:
+                    self.last_failure["reason"] = f"shard {i}: {failure.get('reason')}"
+                return False
+        if self.root is None:
+            return True
+        if not self.root.is_valid(full=full):
+            failure = self.root.last_failure or {}
+            self.last_failure = {"index": failure.get("index"), "reason": f"root chain: {failure.get('reason')}", "shard": None}
+            return False
+        height = self.root.get_height()
+        for index in range(1 if full else max(1, height - 1), height):
+            reason = self._check_root(index)
+            if reason:
+                self.last_failure = {"index": index, "reason": f"root chain: {reason}", "shard": None}
+                return False
+        return True
+
+    def index_backlog(self):
+        return sum(shard.index_backlog() for shard in self.shards)
+
+    def get_receipt(self, token=None, coin_id=None):
+        """A ballot's receipt (see Blockchain.get_receipt) from whichever shard holds it, with
+        the shard number and, when sharded, the root block that commits to it."""
+        for i, shard in enumerate(self.shards):
+            receipt = shard.get_receipt(token=token, coin_id=coin_id)
+            if receipt is not None:
+                receipt["shard"] = i
+                if self.root is not None:
+                    receipt["root"] = self.root_anchor(i, receipt["block_index"])
+                return receipt
+        return None
+
+    def get_inclusion_proof(self, token=None, coin_id=None):
+        for i, shard in enumerate(self.shards):
+            proof = shard.get_inclusion_proof(token=token, coin_id=coin_id)
+            if proof is not None:
+                proof["shard"] = i
+                return proof
+        return None
+
+    def locate_ballot(self, token=None, coin_id=None):
+        """(shard, block, position) of a ballot, or None."""
+        for i, shard in enumerate(self.shards):
+            found = shard.locate_ballot(token=token, coin_id=coin_id)
+            if found is not None:
+                return (i,) + found
+        return None
+
+    # ----------------- Validators -----------------
+    @property
+    def threshold(self):
+        return self.shards[0].threshold
+
+    def get_validator_ids(self):
+        return self.shards[0].get_validator_ids()
+
+    def get_validators_full(self):
+        return self.shards[0].get_validators_full()
+
+    def add_signature_latest(self, validator_id):
+        """Co-sign the latest block of every shard and of the root chain."""
+        return all([chain.add_signature_latest(validator_id) for chain in self._chains()])
+
+    def add_signature_all(self, validator_id):
+        return sum(chain.add_signature_all(validator_id) for chain in self._chains())
+
+    def sign_blocks(self, validator_id, start=None, end=None, shard=None):
+        """Batch co-signing (see Blockchain.sign_blocks). A range applies to one shard
+        (default 0); without a shard or range, every shard and the root chain are signed
+        and the per-chain results are listed under "shards"."""
+        if shard is not None or start is not None or end is not None or self.count == 1:
+            return self.shard(shard or 0).sign_blocks(validator_id, start=start, end=end)
+        results = []
+        for chain in self._chains():
+            result = chain.sign_blocks(validator_id)
+            if result is None:
+                return None
+            results.append(result)
+        for i, result in enumerate(results):
+            result["shard"] = i if i < self.count else "root"
+        return {"signed": sum(r["signed"] for r in results), "shards": results}
+
+    def close(self):
+        self.stop()
+        for chain in self._chains():
+            chain.close()
@@ -0,0 +1,69 @@
+"""canonical_header must produce exactly the bytes of json.dumps(header, sort_keys=True),
+or every stored block hash stops verifying.
+
+    python -m pytest tests        (or: python -m unittest discover tests)
+"""
+import hashlib, json, unittest
+
+from blockchain import block_header, canonical_header, hash_header
+from blocks import Block
+
+PREV = "ab" * 32
+
+BLOCKS = {
+    "genesis": {"version": "1", "index": 0, "timestamp": "2024-05-01 09:00:00",
+                "data": {"voter_id": "0", "vote": "Genesis Block"}, "previous_hash": "0"},
+    "ballot": {"version": "1", "index": 7, "timestamp": "2024-05-01 09:00:07",
+               "data": {"anonymous_token": "tok", "vote": "Aam Aadmi Party (AAP)", "coin_id": "c-7"},
+               "previous_hash": PREV},
+    "non_ascii": {"version": "1", "index": 8, "timestamp": "2024-05-01 09:00:08",
+                  "data": {"vote": "भारतीय जनता पार्टी", "name": "Zoë “quoted” \\ back\nline ",
+                           "emoji": "🗳️"},
+                  "previous_hash": PREV},
+    "floats": {"version": "1", "index": 9, "timestamp": 1714554000.25,
+               "data": {"turnout": 0.1, "big": 1e300, "small": 5e-324, "neg": -0.0, "whole": 3.0, "int": 10 ** 20},
+               "previous_hash": PREV},
+    "nested": {"version": "2", "index": 10, "timestamp": "2024-05-01 09:00:10",
+               "data": {"merkle_root": "cd" * 32, "ballot_count": 2,
+                        "z": {"b": [1, {"y": None, "x": True}], "a": []}, "a": [{"k2": 2, "k1": 1}]},
+               "previous_hash": PREV},
+    "missing_version": {"index": 11, "timestamp": "2024-05-01 09:00:11",
+                        "data": {"vote": "Shiv Sena (SS)"}, "previous_hash": PREV},
+    "empty_data": {"version": "1", "index": 12, "timestamp": "2024-05-01 09:00:12", "data": None,
+                   "previous_hash": None},
+}
+
+
+class CanonicalHeaderTest(unittest.TestCase):
+    def assert_matches_json(self, block):
+        expected = json.dumps(block_header(block), sort_keys=True).encode()
+        self.assertEqual(canonical_header(block), expected)
+        self.assertEqual(hash_header(block), hashlib.sha256(expected).hexdigest())
+
+    def test_plain_dicts(self):
+        for name, block in BLOCKS.items():
+            with self.subTest(name):
+                self.assert_matches_json(block)
+
+    def test_extra_block_fields_are_not_hashed(self):
+        for name, block in BLOCKS.items():
+            with self.subTest(name):
+                full = dict(block, hash="ef" * 32, author="eci", required_signatures=5,
+                            signatures=[{"validator": "eci", "sig": "01" * 32}])
+                self.assertEqual(canonical_header(full), canonical_header(block))
+
+    def test_compact_blocks(self):
+        # Blocks loaded from the log are blocks.Block objects, not dicts
+        for name, block in BLOCKS.items():
+            with self.subTest(name):
+                loaded = Block.from_dict(dict(block, hash="ef" * 32, signatures=[]))
+                self.assert_matches_json(loaded)
+                self.assertEqual(canonical_header(loaded), canonical_header(block))
+
+    def test_missing_version_defaults_to_1(self):
+        block = BLOCKS["missing_version"]
+        self.assertEqual(canonical_header(block), canonical_header(dict(block, version="1")))
+
+
+if __name__ == "__main__":
+    unittest.main()